@@ -0,0 +1,320 @@
+#! /usr/bin/env python
+
+#
+# benchmark-pipeline.py [options]
+#
+# Run export-locales-firefox.sh and import-locales-firefox.sh end to end
+# without a Mac or network access, and report the time spent in each stage.
+#
+# The work folder gets:
+#
+#  firefoxios-l10n.git  bare repo with a corpus from generate-xliff-corpus.py
+#  bin/                 stubs of xcodebuild, xcrun, virtualenv and pip
+#  en.xliff             what the xcodebuild stub exports
+#  firefox-ios/         project root the scripts run in
+#
+# en.xliff is the reference of the corpus with --changed of the strings
+# edited and as many added, and the Storage.strings section under the path
+# Xcode gives it. With --xcloc the stub exports it like Xcode >= 10.
+#
+# The export pipeline runs first, then its branch is pushed to the bare repo
+# and imported, twice: the second import finds all locales unchanged in the
+# manifest. Stages are delimited by the progress messages of the scripts.
+#
+# Options of generate-xliff-corpus.py set the size of the corpus. --output
+# and --compare work like in benchmark-scripts.py.
+#
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import stat
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer
+
+from lxml import etree
+
+from xliff_common import (
+    SCRIPT_FOLDER, SOURCE_TAG, TARGET_TAG, TRANS_UNIT_TAG,
+    file_index, find_units, indent, load_script, parse, serialize,
+)
+
+RESULTS_VERSION = 1
+L10N_REPO = "firefoxios-l10n"
+XLIFF_FILENAME = "firefox-ios.xliff"
+
+generate_xliff_corpus = load_script("generate-xliff-corpus.py")
+benchmark_scripts = load_script("benchmark-scripts.py")
+
+# Progress messages starting each stage, the first stage starts with the
+# script
+EXPORT_STAGES = [
+    (None, "virtualenv"),
+    ("Cloning ", "clone"),
+    ("Exporting en-US with xcodebuild", "xcodebuild"),
+    ("Updating en-US/", "rewrite-originals"),
+    ("Updating locales", "update-xliff"),
+    ("Committing changed locales", "commit-locales"),
+    ("Generating templates", "clean-xliff"),
+]
+
+IMPORT_STAGES = [
+    (None, "virtualenv"),
+    ("Creating firefoxios-l10n Git repo", "clone"),
+    ("Importing locales", "import-locales"),
+]
+
+# Stubs of the macOS tools called by the scripts, %(export)s is replaced by
+# the path of en.xliff
+STUBS = {
+    "xcodebuild": """#! /usr/bin/env bash
+# xcodebuild -exportLocalizations -localizationPath <path> ...
+while [ $# -gt 0 ]; do
+    case $1 in
+        -localizationPath) localization_path="$2"; shift ;;
+    esac
+    shift
+done
+if [ -n "${STUB_XCLOC}" ]; then
+    mkdir -p "${localization_path}/en.xcloc/Localized Contents" || exit 1
+    cp "%(export)s" "${localization_path}/en.xcloc/Localized Contents/en.xliff"
+else
+    cp "%(export)s" "${localization_path}/en.xliff"
+fi
+""",
+    "xcrun": """#! /usr/bin/env bash
+# xcrun --show-sdk-path
+echo /nonexistent/MacOSX.sdk
+""",
+    "virtualenv": """#! /usr/bin/env bash
+# virtualenv <folder> ..., the environment keeps the current python
+mkdir -p "$1/bin" || exit 1
+echo "# virtualenv stub" > "$1/bin/activate"
+""",
+    "pip": """#! /usr/bin/env bash
+# pip install ..., lxml is already installed
+exit 0
+""",
+}
+
+
+def write_stubs(bin_folder, export_path):
+    os.mkdir(bin_folder)
+    for name, content in STUBS.items():
+        path = os.path.join(bin_folder, name)
+        with open(path, "w") as fp:
+            fp.write(content % {"export": export_path})
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def write_export(reference_path, export_path, changed, seed):
+    # Write the en.xliff exported by the xcodebuild stub from the reference
+    # of the corpus: change the source of some strings, add as many new
+    # ones, and use the path Xcode gives to Storage.strings
+    rng = random.Random(seed)
+    tree = parse(reference_path)
+    root = tree.getroot()
+    files = file_index(root)
+    if "Storage.strings" in files:
+        files["Storage.strings"].set("original", "Shared/Supporting Files/Storage.strings")
+    for file_node in files.values():
+        units = find_units(file_node)
+        added = 0
+        for trans_node in units:
+            if rng.random() >= changed:
+                continue
+            text = trans_node.find(SOURCE_TAG).text + " (updated)"
+            for tag in (SOURCE_TAG, TARGET_TAG):
+                node = trans_node.find(tag)
+                if node is not None:
+                    node.text = text
+            new_node = etree.SubElement(trans_node.getparent(), TRANS_UNIT_TAG)
+            new_node.set("id", "Pipeline.New.%d" % added)
+            new_node.set("{http://www.w3.org/XML/1998/namespace}space", "preserve")
+            etree.SubElement(new_node, SOURCE_TAG).text = "New string %d" % added
+            etree.SubElement(new_node, TARGET_TAG).text = "New string %d" % added
+            added += 1
+    indent(root)
+    with open(export_path, "wb") as fp:
+        fp.write(serialize(tree))
+
+
+def git(args, cwd, env=None):
+    return subprocess.check_output(["git"] + args, cwd=cwd, env=env).decode("utf-8").strip()
+
+
+def create_repo(corpus_folder, repo_path, env):
+    # Bare repo with the locale folders of the corpus and templates, like
+    # firefoxios-l10n
+    checkout = corpus_folder
+    subprocess.check_call(
+        [sys.executable, os.path.join(SCRIPT_FOLDER, "clean-xliff.py"),
+         "--source", os.path.join("en-US", XLIFF_FILENAME), "templates", XLIFF_FILENAME],
+        cwd=checkout, stdout=subprocess.PIPE)
+    os.remove(os.path.join(checkout, "corpus.json"))
+    git(["init", "-q"], checkout, env)
+    git(["add", "."], checkout, env)
+    git(["commit", "-q", "-m", "Corpus"], checkout, env)
+    git(["clone", "-q", "--bare", checkout, repo_path], checkout, env)
+
+
+def run_pipeline(command, cwd, env, stages):
+    # Run a pipeline script, returns {stage: seconds}. Stages start when a
+    # line of output starts with their message.
+    started = default_timer()
+    process = subprocess.Popen(command, cwd=cwd, env=env,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = []
+    timings = {}
+    stage, stage_started = stages[0][1], started
+    for line in iter(process.stdout.readline, b""):
+        now = default_timer()
+        line = line.decode("utf-8", "replace")
+        output.append(line)
+        for message, name in stages[1:]:
+            if line.startswith(message):
+                timings[stage] = timings.get(stage, 0) + now - stage_started
+                stage, stage_started = name, now
+                break
+    process.wait()
+    now = default_timer()
+    timings[stage] = timings.get(stage, 0) + now - stage_started
+    if process.returncode != 0:
+        sys.stdout.write("".join(output))
+        raise Exception("%s failed with status %d" % (" ".join(command), process.returncode))
+    timings = dict((name, round(seconds, 6)) for name, seconds in timings.items())
+    timings["total"] = round(now - started, 6)
+    return timings
+
+
+def run(work_folder, args):
+    env = dict(os.environ)
+    env.update({
+        "GIT_AUTHOR_NAME": "Pipeline Benchmark",
+        "GIT_AUTHOR_EMAIL": "pipeline@example.com",
+        "GIT_COMMITTER_NAME": "Pipeline Benchmark",
+        "GIT_COMMITTER_EMAIL": "pipeline@example.com",
+    })
+
+    # Local stand-ins, not timed as part of the pipelines
+    started = default_timer()
+    corpus_folder = os.path.join(work_folder, "corpus")
+    corpus = generate_xliff_corpus.generate(corpus_folder, args)
+    export_path = os.path.join(work_folder, "en.xliff")
+    write_export(os.path.join(corpus_folder, "en-US", XLIFF_FILENAME),
+                 export_path, args.changed, args.seed)
+    repo_path = os.path.join(work_folder, L10N_REPO + ".git")
+    create_repo(corpus_folder, repo_path, env)
+    bin_folder = os.path.join(work_folder, "bin")
+    write_stubs(bin_folder, export_path)
+    project_root = os.path.join(work_folder, "firefox-ios")
+    os.makedirs(os.path.join(project_root, "Client.xcodeproj"))
+    setup_seconds = default_timer() - started
+
+    env["PATH"] = bin_folder + os.pathsep + env.get("PATH", "")
+    env["L10N_REPO_URL"] = repo_path
+    if args.xcloc:
+        env["STUB_XCLOC"] = "1"
+
+    pipelines = {}
+    print("Running export-locales-firefox.sh")
+    sys.stdout.flush()
+    pipelines["export"] = run_pipeline(
+        [os.path.join(SCRIPT_FOLDER, "export-locales-firefox.sh")], project_root, env, EXPORT_STAGES)
+
+    # Import what the export committed
+    checkout = os.path.join(project_root, L10N_REPO)
+    git(["push", "-q", "origin", "HEAD:refs/heads/pipeline"], checkout, env)
+    env["L10N_COMMIT"] = git(["rev-parse", "HEAD"], checkout, env)
+    command = [os.path.join(SCRIPT_FOLDER, "import-locales-firefox.sh")]
+    for name in ("import", "import-unchanged"):
+        print("Running import-locales-firefox.sh")
+        sys.stdout.flush()
+        pipelines[name] = run_pipeline(command, project_root, env, IMPORT_STAGES)
+
+    return {
+        "version": RESULTS_VERSION,
+        "commit": benchmark_scripts.git_commit(),
+        "python": platform.python_version(),
+        "lxml": etree.__version__,
+        "platform": platform.platform(),
+        "xcloc": args.xcloc,
+        "corpus": {
+            "parameters": corpus["parameters"],
+            "locales": len(corpus["locales"]),
+            "total_units": corpus["total_units"],
+        },
+        "setup_seconds": round(setup_seconds, 6),
+        "pipelines": pipelines,
+    }
+
+
+def print_results(results, previous=None):
+    header = "%-18s %-20s %10s" % ("pipeline", "stage", "seconds")
+    if previous is not None:
+        header += " %10s" % "change"
+    print(header)
+    for pipeline, stages in (("export", EXPORT_STAGES), ("import", IMPORT_STAGES),
+                             ("import-unchanged", IMPORT_STAGES)):
+        timings = results["pipelines"][pipeline]
+        for stage in [name for _, name in stages] + ["total"]:
+            if stage not in timings:
+                continue
+            line = "%-18s %-20s %10.3f" % (pipeline, stage, timings[stage])
+            if previous is not None:
+                before = previous["pipelines"].get(pipeline, {}).get(stage)
+                if before:
+                    line += " %+9.1f%%" % ((timings[stage] / before - 1) * 100)
+                else:
+                    line += " %10s" % "-"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--work-dir",
+                        help="Folder to run the pipelines in, must not exist, a temporary folder "
+                             "is used and removed if not set")
+    parser.add_argument("--xcloc", action="store_true",
+                        help="Export en.xliff in en.xcloc like Xcode >= 10")
+    parser.add_argument("--changed", type=float, default=0.05,
+                        help="Ratio of strings changed in the export, as many are added "
+                             "(default: 0.05)")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Compare results with this JSON file from a previous run")
+    generate_xliff_corpus.add_arguments(parser)
+    args = parser.parse_args()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as fp:
+            previous = json.load(fp)
+
+    if args.work_dir:
+        os.makedirs(args.work_dir)
+        work_folder = os.path.abspath(args.work_dir)
+    else:
+        work_folder = tempfile.mkdtemp(prefix="pipeline-")
+    try:
+        results = run(work_folder, args)
+    finally:
+        if not args.work_dir:
+            shutil.rmtree(work_folder)
+
+    print("")
+    if previous is not None and previous.get("corpus") != results["corpus"]:
+        print("WARNING: %s was measured on a different corpus" % args.compare)
+    print_results(results, previous)
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#! /usr/bin/env python
+
+#
+# benchmark-scripts.py [options] [benchmark ...]
+#
+# Time the core functions of the scripts in this repository on a corpus
+# generated by generate-xliff-corpus.py, and report their throughput in
+# strings (trans-units) per second and their peak memory.
+#
+# Without --corpus, a corpus is generated in a temporary folder with the
+# options of generate-xliff-corpus.py. Each benchmark runs in its own
+# process, so that peak memory only includes its own work, on a copy of the
+# corpus made before timing starts. The best time of --repeat runs is kept.
+#
+# --output writes the results as JSON, with the commit and versions they
+# were measured with. --compare prints the change against such a file, e.g.
+#
+#   ./benchmark-scripts.py --output before.json
+#   git checkout my-branch
+#   ./benchmark-scripts.py --compare before.json
+#
+
+import argparse
+import glob
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from timeit import default_timer
+
+from lxml import etree
+
+from xliff_common import SCRIPT_FOLDER, load_script
+
+RESULTS_VERSION = 1
+REFERENCE_LOCALE = "en-US"
+XLIFF_FILENAME = "firefox-ios.xliff"
+
+generate_xliff_corpus = load_script("generate-xliff-corpus.py")
+update_xliff = load_script("update-xliff.py")
+
+
+def locale_files(folder, reference=True):
+    file_paths = sorted(glob.glob(os.path.join(folder, "*", XLIFF_FILENAME)))
+    if not reference:
+        file_paths = [file_path for file_path in file_paths
+                      if file_path.split(os.sep)[-2] != REFERENCE_LOCALE]
+    return file_paths
+
+
+def count_units(corpus, reference=True):
+    return sum(locale["units"] for name, locale in corpus["locales"].items()
+               if reference or name != REFERENCE_LOCALE)
+
+
+# Benchmarks, each function gets a copy of the corpus and returns a function
+# doing the timed work, and the number of strings it processes.
+
+def bench_update_xliff(folder, corpus):
+    reference_file_path = os.path.join(folder, REFERENCE_LOCALE, XLIFF_FILENAME)
+
+    def run():
+        updater = update_xliff.LocaleUpdater(
+            update_xliff.ReferenceTemplate.load(reference_file_path))
+        for file_path in locale_files(folder, reference=False):
+            updater.update(file_path)
+    return run, count_units(corpus, reference=False)
+
+
+def bench_xliff_cleanup(folder, corpus, stream=False):
+    xliff_cleanup = load_script("xliff-cleanup.py")
+    cleanup = xliff_cleanup.cleanup_stream if stream else xliff_cleanup.cleanup_tree
+
+    def run():
+        rules = xliff_cleanup.compile_rules()
+        for file_path in locale_files(folder):
+            cleanup(file_path, rules)
+    return run, count_units(corpus)
+
+
+def bench_xliff_cleanup_stream(folder, corpus):
+    return bench_xliff_cleanup(folder, corpus, stream=True)
+
+
+def bench_clean_xliff(folder, corpus):
+    clean_xliff = load_script("clean-xliff.py")
+
+    def run():
+        for file_path in locale_files(folder, reference=False):
+            clean_xliff.clean_file(file_path, file_path)
+    return run, count_units(corpus, reference=False)
+
+
+def bench_xliff_to_strings(folder, corpus, engine="python"):
+    xliff_to_strings = load_script("xliff-to-strings.py")
+    export_root = os.path.join(folder, "export")
+    os.mkdir(export_root)
+
+    def run():
+        # Strings files are written relative to the current folder
+        os.chdir(export_root)
+        for file_path in locale_files(folder):
+            result = xliff_to_strings.export_locale(file_path, export_root, engine=engine)
+            if result["error"] is not None:
+                raise Exception(result["error"])
+    return run, count_units(corpus)
+
+
+def bench_xliff_to_strings_xslt(folder, corpus):
+    return bench_xliff_to_strings(folder, corpus, engine="xslt")
+
+
+def bench_import_locales(folder, corpus):
+    import_locales = load_script("import-locales.py")
+    export_root = os.path.join(folder, "export")
+    os.mkdir(export_root)
+    reference_file_path = os.path.join(folder, REFERENCE_LOCALE, XLIFF_FILENAME)
+    args = argparse.Namespace(export_root=export_root, write_xliff=False,
+                              encoding="utf-8", format="text", engine="python")
+
+    def run():
+        os.chdir(export_root)
+        reference_template = import_locales.update_xliff.ReferenceTemplate.load(reference_file_path)
+        rules = import_locales.xliff_cleanup.compile_rules()
+        for file_path in locale_files(folder):
+            result = import_locales.import_locale(file_path, reference_template, rules, args, None)
+            if result["error"] is not None:
+                raise Exception(result["error"])
+    return run, count_units(corpus)
+
+
+BENCHMARKS = [
+    ("update-xliff", bench_update_xliff),
+    ("xliff-cleanup", bench_xliff_cleanup),
+    ("xliff-cleanup-stream", bench_xliff_cleanup_stream),
+    ("clean-xliff", bench_clean_xliff),
+    ("xliff-to-strings", bench_xliff_to_strings),
+    ("xliff-to-strings-xslt", bench_xliff_to_strings_xslt),
+    ("import-locales", bench_import_locales),
+]
+
+
+def copy_corpus(corpus_folder, folder):
+    for file_path in locale_files(corpus_folder):
+        locale = file_path.split(os.sep)[-2]
+        os.mkdir(os.path.join(folder, locale))
+        shutil.copy(file_path, os.path.join(folder, locale, XLIFF_FILENAME))
+
+
+def run_benchmark(name, corpus_folder, repeat):
+    # Run a benchmark in the current process, returns its result dictionary
+    with open(os.path.join(corpus_folder, "corpus.json")) as fp:
+        corpus = json.load(fp)
+    benchmark = dict(BENCHMARKS)[name]
+    times = []
+    for _ in range(repeat):
+        folder = tempfile.mkdtemp(prefix="benchmark-")
+        try:
+            copy_corpus(corpus_folder, folder)
+            run, units = benchmark(folder, corpus)
+            started = default_timer()
+            run()
+            times.append(default_timer() - started)
+        finally:
+            os.chdir(SCRIPT_FOLDER)
+            shutil.rmtree(folder)
+    best = min(times)
+    return {
+        "seconds": round(best, 6),
+        "times": [round(seconds, 6) for seconds in times],
+        "units": units,
+        "units_per_second": round(units / best, 1) if best else None,
+        "peak_rss_kb": update_xliff.peak_rss(),
+    }
+
+
+def run_benchmark_process(name, corpus_folder, repeat):
+    # Run a benchmark in a child process, which prints its result as JSON
+    output = subprocess.check_output([
+        sys.executable, os.path.abspath(__file__), "--run", name,
+        "--corpus", corpus_folder, "--repeat", str(repeat),
+    ])
+    return json.loads(output.decode("utf-8"))
+
+
+def git_commit():
+    try:
+        with open(os.devnull, "w") as devnull:
+            output = subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], cwd=SCRIPT_FOLDER, stderr=devnull)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode("ascii").strip()
+
+
+def print_results(results, previous=None):
+    header = "%-24s %10s %10s %12s %10s" % ("benchmark", "units", "seconds", "units/s", "peak MiB")
+    if previous is not None:
+        header += " %10s" % "change"
+    print(header)
+    for name, _ in BENCHMARKS:
+        result = results["benchmarks"].get(name)
+        if result is None:
+            continue
+        line = "%-24s %10d %10.3f %12.1f %10.1f" % (
+            name, result["units"], result["seconds"], result["units_per_second"],
+            result["peak_rss_kb"] / 1024.0)
+        if previous is not None:
+            before = previous["benchmarks"].get(name)
+            if before and before["units_per_second"]:
+                change = result["units_per_second"] / before["units_per_second"] - 1
+                line += " %+9.1f%%" % (change * 100)
+            else:
+                line += " %10s" % "-"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark",
+                        help="Benchmarks to run (default: all): %s" % ", ".join(
+                            name for name, _ in BENCHMARKS))
+    parser.add_argument("--corpus",
+                        help="Corpus folder created by generate-xliff-corpus.py, a corpus is "
+                             "generated in a temporary folder if not set")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of runs of each benchmark, the best time is kept (default: 3)")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Compare results with this JSON file from a previous run")
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    generate_xliff_corpus.add_arguments(parser)
+    args = parser.parse_args()
+
+    names = [name for name, _ in BENCHMARKS]
+    for name in args.benchmarks + ([args.run] if args.run else []):
+        if name not in names:
+            parser.error("unknown benchmark %s" % name)
+
+    if args.run:
+        print(json.dumps(run_benchmark(args.run, os.path.abspath(args.corpus), args.repeat)))
+        return
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as fp:
+            previous = json.load(fp)
+
+    temp_folder = None
+    corpus_folder = args.corpus
+    if corpus_folder is None:
+        temp_folder = tempfile.mkdtemp(prefix="corpus-")
+        corpus_folder = temp_folder
+        generate_xliff_corpus.generate(corpus_folder, args)
+    corpus_folder = os.path.abspath(corpus_folder)
+
+    try:
+        with open(os.path.join(corpus_folder, "corpus.json")) as fp:
+            corpus = json.load(fp)
+        results = {
+            "version": RESULTS_VERSION,
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "lxml": etree.__version__,
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "corpus": {
+                "parameters": corpus["parameters"],
+                "locales": len(corpus["locales"]),
+                "total_units": corpus["total_units"],
+            },
+            "benchmarks": {},
+        }
+        for name in args.benchmarks or names:
+            print("Running %s" % name)
+            sys.stdout.flush()
+            results["benchmarks"][name] = run_benchmark_process(name, corpus_folder, args.repeat)
+    finally:
+        if temp_folder is not None:
+            shutil.rmtree(temp_folder)
+
+    print("")
+    if previous is not None and previous.get("corpus") != results["corpus"]:
+        print("WARNING: %s was measured on a different corpus" % args.compare)
+    print_results(results, previous)
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2, sort_keys=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#
+# binary_plist.py
+#
+# Writer for binary property lists (bplist00), used by xliff-to-strings.py to
+# export compiled .strings files without plutil. Only dictionaries of strings
+# are supported, which is all a .strings file contains.
+#
+# Output only depends on the input: keys keep the order they're given in,
+# and identical strings are stored once.
+#
+
+import struct
+
+HEADER = b'bplist00'
+
+# Object markers, the low nibble holds the length when it's below 15
+MARKER_INT = 0x10
+MARKER_ASCII = 0x50
+MARKER_UTF16 = 0x60
+MARKER_DICT = 0xD0
+
+
+def int_size(value):
+    # Number of bytes needed to store an unsigned value in the offset table
+    # or in object references
+    for size in (1, 2, 4):
+        if value < 1 << (8 * size):
+            return size
+    return 8
+
+
+def pack_uint(value, size):
+    return struct.pack('>' + {1: 'B', 2: 'H', 4: 'L', 8: 'Q'}[size], value)
+
+
+def object_header(marker, length):
+    # Marker byte, followed by an int object if the length doesn't fit in
+    # the low nibble
+    if length < 15:
+        return struct.pack('>B', marker | length)
+    size = int_size(length)
+    exponent = {1: 0, 2: 1, 4: 2, 8: 3}[size]
+    return struct.pack('>BB', marker | 0xF, MARKER_INT | exponent) + pack_uint(length, size)
+
+
+def encode_string(text):
+    try:
+        data = text.encode('ascii')
+        return object_header(MARKER_ASCII, len(data)) + data
+    except UnicodeError:
+        data = text.encode('utf-16-be')
+        return object_header(MARKER_UTF16, len(data) // 2) + data
+
+
+def dumps(items):
+    # Serialize a dictionary of strings, given as (key, value) pairs, to a
+    # binary property list. If a key is repeated, the last value is used.
+    values = {}
+    keys = []
+    for key, value in items:
+        if key not in values:
+            keys.append(key)
+        values[key] = value
+
+    # Object 0 is the dictionary, followed by unique strings in the order
+    # they're first used
+    references = {}
+    strings = []
+    for text in keys + [values[key] for key in keys]:
+        if text not in references:
+            references[text] = len(strings) + 1
+            strings.append(text)
+    reference_size = int_size(len(strings) + 1)
+
+    objects = [object_header(MARKER_DICT, len(keys)) + b''.join(
+        pack_uint(references[text], reference_size)
+        for text in keys + [values[key] for key in keys]
+    )]
+    objects.extend(encode_string(text) for text in strings)
+
+    offsets = []
+    offset = len(HEADER)
+    for data in objects:
+        offsets.append(offset)
+        offset += len(data)
+    offset_size = int_size(offset)
+
+    trailer = struct.pack(
+        '>6xBBQQQ', offset_size, reference_size, len(objects), 0, offset)
+    return b''.join(
+        [HEADER] + objects + [pack_uint(value, offset_size) for value in offsets] + [trailer])
@@ -1,73 +1,67 @@
 #! /usr/bin/env python
 
 #
-# clean-xliff.py <l10n_folder> <xliff_file>
+# clean-xliff.py [--source <xliff_file>] <l10n_folder> <xliff_file>
 #
 # Remove targets from a locale, remove target-language attribute
 #
+# With --source, read the XLIFF file to clean up (e.g. the en-US file) and
+# write the result in l10n_folder instead of cleaning up the existing file,
+# e.g. to generate templates from en-US.
+#
 
-from glob import glob
-from lxml import etree
 import argparse
 import os
 
-NS = {'x':'urn:oasis:names:tc:xliff:document:1.2'}
+from xliff_common import FILE_TAG, TRANS_UNIT_TAG, TARGET_TAG, indent, parse, serialize
+
+def clean_file(source_path, file_path):
+    # Read source_path, remove translations and target-language, and write
+    # the result to file_path
+    locale_tree = parse(source_path)
+    locale_root = locale_tree.getroot()
+
+    # Remove existing localizations and target-language in a single walk
+    # over the tree. Targets are removed once the walk is over, since
+    # removing nodes would break the iteration.
+    targets = []
+    for node in locale_root.iter(FILE_TAG, TARGET_TAG):
+        if node.tag == FILE_TAG:
+            # Remove target-language where defined
+            if node.get('target-language'):
+                node.attrib.pop('target-language')
+        elif node.getparent().tag == TRANS_UNIT_TAG:
+            targets.append(node)
+    for child in targets:
+        child.getparent().remove(child)
+
+    # Fix indentations once all changes are done
+    indent(locale_root)
+    xliff_content = serialize(locale_tree)
 
-def indent(elem, level=0):
-    # Prettify XML output
-    # http://effbot.org/zone/element-lib.htm#prettyprint
-    i = '\n' + level*'  '
-    if len(elem):
-        if not elem.text or not elem.text.strip():
-            elem.text = i + '  '
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = i
-        for elem in elem:
-            indent(elem, level+1)
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = i
-    else:
-        if level and (not elem.tail or not elem.tail.strip()):
-            elem.tail = i
+    # Replace the existing locale file with the new XML content
+    l10n_folder = os.path.dirname(file_path)
+    if l10n_folder and not os.path.isdir(l10n_folder):
+        os.makedirs(l10n_folder)
+    with open(file_path, 'wb') as fp:
+        fp.write(xliff_content)
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('l10n_folder', help='Path to locale folder to clean up')
     parser.add_argument('xliff_file', help='Name of the XLIFF file, e.g. firefox-ios.xliff')
+    parser.add_argument('--source', metavar='SOURCE_FILE',
+                        help='Read this XLIFF file instead of the one in l10n_folder, '
+                             'e.g. en-US/firefox-ios.xliff to generate templates')
     args = parser.parse_args()
 
     xliff_filename = args.xliff_file
-    file_path = os.path.join(
-                    os.path.realpath(args.l10n_folder),
-                    xliff_filename
-                )
-
-    print 'Updating %s' % file_path
-
-    # Read localized file XML
-    locale_tree = etree.parse(file_path)
-    locale_root = locale_tree.getroot()
-
-    # Remove existing localizations and target-language
-    for trans_node in locale_root.xpath('//x:trans-unit', namespaces=NS):
-        for child in trans_node.xpath('./x:target', namespaces=NS):
-            child.getparent().remove(child)
+    l10n_folder = os.path.realpath(args.l10n_folder)
+    file_path = os.path.join(l10n_folder, xliff_filename)
+    source_path = args.source or file_path
 
-        # Remove target-language where defined
-        for file_node in locale_root.xpath('//x:file', namespaces=NS):
-            if file_node.get('target-language'):
-                file_node.attrib.pop('target-language')
-        # Replace the existing locale file with the new XML content
-        with open(file_path, 'w') as fp:
-            # Fix indentations
-            indent(locale_root)
-            xliff_content = etree.tostring(
-                                locale_tree,
-                                encoding='UTF-8',
-                                xml_declaration=True,
-                                pretty_print=True
-                            )
-            fp.write(xliff_content)
+    print('Updating %s' % file_path)
+    clean_file(source_path, file_path)
 
 if __name__ == '__main__':
     main()
@@ -14,6 +14,9 @@
 # We can probably check all that for the sake of running this hands-free
 # in an automated manner.
 #
+# L10N_REPO_URL overrides the URL the l10n repo is cloned from, e.g. a local
+# repo (see benchmark-pipeline.py).
+#
 
 clean_run=false
 if [ $# -ge 3 ]
@@ -72,71 +75,62 @@ else
 fi
 
 # Check out a clean copy of the l10n repo
-git clone https://github.com/mozilla-l10n/${l10n_repo} || exit 1
+echo "Cloning ${l10n_repo}"
+git clone "${L10N_REPO_URL:-https://github.com/mozilla-l10n/${l10n_repo}}" ${l10n_repo} || exit 1
 
 # Export English base to /tmp/en.xliff
 rm -f /tmp/en.xliff || exit 1
 rm -f  "/tmp/en.xcloc/Localized Contents/en.xliff" # for Xcode >= 10
 echo "Exporting en-US with xcodebuild"
 xcodebuild -exportLocalizations -localizationPath /tmp -project ${xcodeproj} -exportLanguage en || exit 1
+en_xliff=/tmp/en.xliff
 if [ -f "/tmp/en.xcloc/Localized Contents/en.xliff" ]
 then
   # Xcode >= 10 puts the file in en.xcloc
-  cp "/tmp/en.xcloc/Localized Contents/en.xliff" /tmp/en.xliff || exit 1
+  en_xliff="/tmp/en.xcloc/Localized Contents/en.xliff"
 fi
- 
 
-if [ ! -f /tmp/en.xliff ]
+if [ ! -f "${en_xliff}" ]
 then
-  echo "Export failed. No /tmp/en.xliff generated."
+  echo "Export failed. No ${en_xliff} generated."
   exit 1
 fi
 
-# Fix the Focus export
-/usr/bin/perl -p -i -e "s|Blockzilla/en.lproj/Intro.strings|Blockzilla/Intro.strings|g" /tmp/en.xliff
-/usr/bin/perl -p -i -e "s|Blockzilla/en.lproj/InfoPlist.strings|Blockzilla/InfoPlist.strings|g" /tmp/en.xliff
-/usr/bin/perl -p -i -e "s|Blockzilla/en.lproj/Intro.strings|Blockzilla/Intro.strings|g" /tmp/en.xliff
-/usr/bin/perl -p -i -e "s|Blockzilla/en.lproj/Intents.strings|Blockzilla/Intents.strings|g" /tmp/en.xliff
-/usr/bin/perl -p -i -e "s|ContentBlocker/en.lproj/InfoPlist.strings|ContentBlocker/InfoPlist.strings|g" /tmp/en.xliff
-/usr/bin/perl -p -i -e "s|OpenInFocus/en.lproj/InfoPlist.strings|OpenInFocus/InfoPlist.strings|g" /tmp/en.xliff
-/usr/bin/perl -p -i -e "s|CredentialProvider/en.lproj/InfoPlist.strings|CredentialProvider/InfoPlist.strings|g" /tmp/en.xliff
-/usr/bin/perl -p -i -e "s|CredentialProvider/en.lproj/Localizable.strings|CredentialProvider/Localizable.strings|g" /tmp/en.xliff
-/usr/bin/perl -p -i -e "s|lockbox-ios/Common/Resources/en.lproj/InfoPlist.strings|lockbox-ios/Common/Resources/InfoPlist.strings|g" /tmp/en.xliff
-/usr/bin/perl -p -i -e "s|lockbox-ios/Common/Resources/Strings/en.lproj/Localizable.strings|lockbox-ios/Common/Resources/Strings/Localizable.strings|g" /tmp/en.xliff
-
-/usr/bin/perl -p -i -e "s|Shared/Supporting Files/Intro.strings|Client/Intro.strings|g" /tmp/en.xliff
-/usr/bin/perl -p -i -e "s|Shared/Supporting Files/Storage.strings|Storage.strings|g" /tmp/en.xliff
-
 # Create a branch in the repository
 cd ${l10n_repo}
 branch_name=$(date +"%Y%m%d_%H%M")
 git branch ${branch_name}
 git checkout ${branch_name}
 
-# Copy the English XLIFF file into the repository and commit
-cp /tmp/en.xliff en-US/${l10n_file} || exit 1
+# Copy the English XLIFF file into the repository, fixing the paths of
+# strings files in the Focus, Lockwise and Firefox exports, and commit
+echo "Updating en-US/${l10n_file}"
+${SCRIPTS}/rewrite-originals.py "${en_xliff}" en-US/${l10n_file} || exit 1
 git add en-US/${l10n_file}
 git commit -m "en-US: update ${l10n_file}"
 
-# Update all locales
-${SCRIPTS}/update-xliff.py . ${l10n_file} || exit 1
+# Update all locales, one worker per available core. Only locales whose
+# file changed are listed in the manifest.
+echo "Updating locales"
+rm -f /tmp/changed-locales.txt || exit 1
+${SCRIPTS}/update-xliff.py --jobs $(getconf _NPROCESSORS_ONLN) --manifest /tmp/changed-locales.txt . ${l10n_file} || exit 1
 
-# Commit each locale separately
-locale_list=$(find . -mindepth 1 -maxdepth 1 -type d  \( ! -iname ".*" \) | sed 's|^\./||g' | sort)
-for locale in ${locale_list};
+# Commit each changed locale separately
+echo "Committing changed locales"
+for locale in $(cat /tmp/changed-locales.txt);
 do
-    # Exclude en-US and templates
-    if [ "${locale}" != "en-US" ] && [ "${locale}" != "templates" ]
+    # Exclude templates
+    if [ "${locale}" != "templates" ]
     then
         git add ${locale}/${l10n_file}
         git commit -m "${locale}: Update ${l10n_file}"
     fi
 done
 
-# Copy the en-US file in /templates
-cp en-US/${l10n_file} templates/${l10n_file} || exit 1
-# Clean up /templates removing target-language and translations
-${SCRIPTS}/clean-xliff.py templates ${l10n_file} || exit 1
+# Generate /templates from the en-US file, removing target-language and
+# translations
+echo "Generating templates"
+${SCRIPTS}/clean-xliff.py --source en-US/${l10n_file} templates ${l10n_file} || exit 1
 git add templates/${l10n_file}
 git commit -m "templates: update ${l10n_file}"
 
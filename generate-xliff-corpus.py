@@ -0,0 +1,344 @@
+#! /usr/bin/env python
+
+#
+# generate-xliff-corpus.py [options] <output_folder>
+#
+# Generate a synthetic l10n repository shaped like firefoxios-l10n, to
+# measure the scripts of this repository (see benchmark-scripts.py):
+#
+#  en-US/firefox-ios.xliff
+#  fr/firefox-ios.xliff
+#  ...
+#  corpus.json
+#
+# The reference has --files sections of strings files and --info-plists
+# sections of Info.plist files, with about --units strings each (the first
+# section, Client/Localizable.strings, is bigger like in the real project).
+# Strings include format specifiers, quotes, ampersands and line breaks,
+# and --notes of them have a note.
+#
+# Each locale is translated from the reference with one of the --translated
+# ratios, in turn. --stale of the strings are missing from locales, and as
+# many obsolete strings are added, like in locales exported from an older
+# reference.
+#
+# corpus.json has the parameters and the number of strings in each file.
+# The same parameters and --seed always give the same corpus.
+#
+
+import argparse
+import io
+import json
+import os
+import random
+
+# Locale folders, more locales get generated codes
+LOCALES = [
+    "fr", "de", "es-ES", "it", "ja", "zh-CN", "pt-BR", "ru", "nb-NO", "sv-SE",
+    "tl", "pl", "nl", "ko", "tr", "uk", "cs", "da", "fi", "he", "id", "hu",
+    "ro", "sk", "sl", "ga-IE", "nn-NO", "zgh", "sat", "el",
+]
+
+# Locales translated with CJK characters instead of accented ones
+CJK_LOCALES = ("ja", "zh-CN", "ko")
+
+# Sections exported by xliff-to-strings.py, more sections get generated names
+# and are only read by the other scripts
+STRINGS_FILES = [
+    "Client/Localizable.strings",
+    "Client/3DTouchActions.strings",
+    "Client/AuthenticationManager.strings",
+    "Client/BookmarkPanel.strings",
+    "Client/ClearPrivateData.strings",
+    "Client/ErrorPages.strings",
+    "Client/FindInPage.strings",
+    "Client/HistoryPanel.strings",
+    "Client/Intro.strings",
+    "Client/LoginManager.strings",
+    "Client/Menu.strings",
+    "Client/PrivateBrowsing.strings",
+    "Client/Search.strings",
+    "Client/SendTo.strings",
+    "Shared/Supporting Files/Shared.strings",
+    "Shared/Supporting Files/Today.strings",
+    "Storage.strings",
+    "Extensions/Today/Today.strings",
+    "Client/BookmarkPanelDeleteConfirm.strings",
+    "Client/ClearHistoryConfirm.strings",
+    "Client/ClearPrivateDataConfirm.strings",
+    "Client/LightweightThemes.strings",
+    "Client/SendAnonymousUsageData.strings",
+    "Shared/Supporting Files/Default Browser.strings",
+]
+
+INFO_PLISTS = [
+    "Client/Info.plist",
+    "Extensions/Today/Info.plist",
+    "Extensions/SendTo/Info.plist",
+    "Extensions/ShareTo/Info.plist",
+    "Shared/Supporting Files/Info.plist",
+    "Extensions/NotificationService/Info.plist",
+]
+
+INFO_PLIST_KEYS = [
+    ("CFBundleDisplayName", "Firefox"),
+    ("CFBundleName", "$(PRODUCT_NAME)"),
+    ("CFBundleShortVersionString", "$(MARKETING_VERSION)"),
+    ("NSCameraUsageDescription", "This lets you take and upload photos."),
+    ("NSLocationWhenInUseUsageDescription", "Websites you visit may request your location."),
+    ("NSMicrophoneUsageDescription", "This lets you take and upload videos."),
+    ("NSPhotoLibraryAddUsageDescription", "This lets you save images to your Camera Roll."),
+    ("ShortcutItemTitleNewTab", "New Tab"),
+    ("ShortcutItemTitleNewPrivateTab", "New Private Tab"),
+]
+
+WORDS = (
+    "tab tabs bookmark bookmarks history page pages site sites search engine "
+    "private browsing mode open close new delete remove cancel save share send "
+    "device devices account sign in out sync settings login logins password "
+    "passwords reading list download downloads file files update clear data "
+    "website address copy link links paste go back forward reload stop home "
+    "top recent today yesterday week show hide all your this that with from"
+).split()
+
+NOTE_PREFIXES = [
+    "Title for the button that",
+    "Label of the menu item that",
+    "Message shown when the user",
+    "Accessibility label for the option that",
+    "Text of the alert displayed after the user",
+]
+
+XLIFF_HEADER = (
+    u'<?xml version="1.0" encoding="UTF-8"?>\n'
+    u'<xliff xmlns="urn:oasis:names:tc:xliff:document:1.2" '
+    u'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" version="1.2" '
+    u'xsi:schemaLocation="urn:oasis:names:tc:xliff:document:1.2 '
+    u'http://docs.oasis-open.org/xliff/v1.2/os/xliff-core-1.2-strict.xsd">\n'
+)
+
+FILE_HEADER = (
+    u'  <file original="%s" source-language="en" target-language="%s" datatype="plaintext">\n'
+    u'    <header>\n'
+    u'      <tool tool-id="com.apple.dt.xcode" tool-name="Xcode" tool-version="12.4" build-num="12D4e"/>\n'
+    u'    </header>\n'
+    u'    <body>\n'
+)
+
+
+def escape(text):
+    return text.replace(u"&", u"&amp;").replace(u"<", u"&lt;").replace(u">", u"&gt;").replace(u'"', u"&quot;")
+
+
+def locale_codes(count):
+    codes = LOCALES[:count]
+    codes.extend("x-%d" % index for index in range(len(codes), count))
+    return codes
+
+
+def random_sentence(rng, minimum, maximum):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(minimum, maximum))]
+    return u" ".join(words).capitalize()
+
+
+def random_source(rng):
+    # English string, with the special characters found in real strings
+    text = random_sentence(rng, 1, 12)
+    roll = rng.random()
+    if roll < 0.10:
+        text += u" %@"
+    elif roll < 0.15:
+        text = u"%d " + text
+    elif roll < 0.20:
+        text = u"\u201c%@\u201d " + text
+    elif roll < 0.23:
+        text += u' "' + rng.choice(WORDS) + u'"'
+    elif roll < 0.26:
+        text += u" & " + random_sentence(rng, 1, 3).lower()
+    elif roll < 0.28:
+        text += u"\n" + random_sentence(rng, 2, 6)
+    return text
+
+
+def strings_units(rng, file_name, count, notes):
+    # [(id, source, note)] for a strings file. Ids are either keys or the
+    # English string, like NSLocalizedString() without a key.
+    units = []
+    seen = set()
+    prefix = os.path.splitext(os.path.basename(file_name))[0]
+    while len(units) < count:
+        source = random_source(rng)
+        if rng.random() < 0.5:
+            unit_id = u"%s.%s.%d" % (prefix, rng.choice(WORDS).capitalize(), len(units))
+        else:
+            unit_id = source
+        if unit_id in seen:
+            continue
+        seen.add(unit_id)
+        note = None
+        if rng.random() < notes:
+            note = u"%s %s" % (rng.choice(NOTE_PREFIXES), random_sentence(rng, 2, 8).lower())
+        units.append((unit_id, source, note))
+    return units
+
+
+def info_plist_units(rng, count, notes):
+    keys = INFO_PLIST_KEYS[:max(count, 1)]
+    return [(key, source, u"Privacy - %s" % key if rng.random() < notes else None)
+            for key, source in keys]
+
+
+def reference_files(rng, args):
+    # [(original, [(id, source, note)])] in document order
+    files = []
+    for index in range(args.files):
+        if index < len(STRINGS_FILES):
+            file_name = STRINGS_FILES[index]
+        else:
+            file_name = "Client/Generated%03d.strings" % index
+        if index == 0:
+            count = args.units * 4
+        else:
+            count = max(1, int(args.units * rng.uniform(0.2, 1.8)))
+        files.append((file_name, strings_units(rng, file_name, count, args.notes)))
+    for index in range(args.info_plists):
+        if index < len(INFO_PLISTS):
+            file_name = INFO_PLISTS[index]
+        else:
+            file_name = "Extensions/Generated%03d/Info.plist" % index
+        files.append((file_name, info_plist_units(rng, args.units, args.notes)))
+    return files
+
+
+def translate(rng, locale, text):
+    # Pseudo translation that keeps format specifiers and line breaks, with
+    # characters outside of ASCII
+    if locale in CJK_LOCALES:
+        def word(match):
+            return u"".join(
+                u"%c" % rng.randint(0x4e00, 0x4fff) for _ in range(max(1, len(match) // 2)))
+    else:
+        table = dict((ord(a), b) for a, b in zip(u"aeiou", u"\u00e0\u00e9\u00ee\u00f6\u00fb"))
+
+        def word(match):
+            return match.translate(table)
+    parts = []
+    for token in text.split(u" "):
+        if token.isalpha():
+            parts.append(word(token))
+        else:
+            parts.append(token)
+    return u" ".join(parts)
+
+
+def write_locale(rng, path, locale, files, translated, stale):
+    # Write a locale file generated from the reference files, returns the
+    # number of strings written and translated
+    target_language = "en" if locale == "en-US" else locale
+    units_written = 0
+    units_translated = 0
+    with io.open(path, "w", encoding="utf-8") as fp:
+        fp.write(XLIFF_HEADER)
+        for file_name, units in files:
+            fp.write(FILE_HEADER % (escape(file_name), target_language))
+            obsolete = 0
+            for unit_id, source, note in units:
+                if locale != "en-US" and rng.random() < stale:
+                    obsolete += 1
+                    continue
+                target = None
+                if locale == "en-US":
+                    target = source
+                elif rng.random() < translated:
+                    target = translate(rng, locale, source)
+                write_unit(fp, unit_id, source, target, note)
+                units_written += 1
+                units_translated += target is not None
+            for index in range(obsolete):
+                source = random_source(rng)
+                write_unit(fp, u"Obsolete.%d" % index, source, translate(rng, locale, source), None)
+                units_written += 1
+                units_translated += 1
+            fp.write(u"    </body>\n  </file>\n")
+        fp.write(u"</xliff>\n")
+    return units_written, units_translated
+
+
+def write_unit(fp, unit_id, source, target, note):
+    fp.write(u'      <trans-unit id="%s" xml:space="preserve">\n' % escape(unit_id))
+    fp.write(u"        <source>%s</source>\n" % escape(source))
+    if target is not None:
+        fp.write(u"        <target>%s</target>\n" % escape(target))
+    if note is not None:
+        fp.write(u"        <note>%s</note>\n" % escape(note))
+    fp.write(u"      </trans-unit>\n")
+
+
+def generate(output_folder, args):
+    # Generate the corpus, returns the content of corpus.json
+    rng = random.Random(args.seed)
+    files = reference_files(rng, args)
+    ratios = [float(ratio) for ratio in args.translated.split(",")]
+    corpus = {
+        "version": 1,
+        "parameters": {
+            "locales": args.locales,
+            "files": args.files,
+            "info_plists": args.info_plists,
+            "units": args.units,
+            "notes": args.notes,
+            "translated": args.translated,
+            "stale": args.stale,
+            "seed": args.seed,
+        },
+        "reference_units": sum(len(units) for _, units in files),
+        "locales": {},
+    }
+    for index, locale in enumerate(["en-US"] + locale_codes(args.locales)):
+        folder = os.path.join(output_folder, locale)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        ratio = ratios[(index - 1) % len(ratios)]
+        written, translated = write_locale(
+            rng, os.path.join(folder, "firefox-ios.xliff"), locale, files, ratio, args.stale)
+        corpus["locales"][locale] = {"units": written, "translated": translated}
+    corpus["total_units"] = sum(locale["units"] for locale in corpus["locales"].values())
+    with open(os.path.join(output_folder, "corpus.json"), "w") as fp:
+        json.dump(corpus, fp, indent=2, sort_keys=True)
+    return corpus
+
+
+def add_arguments(parser):
+    # Options shared with benchmark-scripts.py
+    parser.add_argument("--locales", type=int, default=10,
+                        help="Number of locales besides en-US (default: 10)")
+    parser.add_argument("--files", type=int, default=20,
+                        help="Number of strings file sections (default: 20)")
+    parser.add_argument("--info-plists", type=int, default=4,
+                        help="Number of Info.plist sections (default: 4)")
+    parser.add_argument("--units", type=int, default=150,
+                        help="Average number of strings in a strings file section (default: 150)")
+    parser.add_argument("--notes", type=float, default=0.8,
+                        help="Ratio of strings with a note (default: 0.8)")
+    parser.add_argument("--translated", default="0.95,0.8,0.6,0.3",
+                        help="Comma separated translation ratios, used by locales in turn "
+                             "(default: 0.95,0.8,0.6,0.3)")
+    parser.add_argument("--stale", type=float, default=0.02,
+                        help="Ratio of strings missing from locales, replaced by obsolete "
+                             "ones (default: 0.02)")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed (default: 1)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("output_folder", help="Folder to create the locale folders in")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    corpus = generate(args.output_folder, args)
+    print("Generated %d locales with %d strings in %s" % (
+        len(corpus["locales"]), corpus["total_units"], args.output_folder))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
 #! /usr/bin/env bash
 
+#
+# L10N_REPO_URL and L10N_COMMIT override the URL firefoxios-l10n is cloned
+# from and the commit checked out, e.g. a local repo (see
+# benchmark-pipeline.py).
+#
+
 if [ ! -d Client.xcodeproj ]; then
     echo "Please run this from the project root that contains Client.xcodeproj"
     exit 1
@@ -36,9 +42,9 @@ fi
 
 echo "Creating firefoxios-l10n Git repo"
 rm -rf firefoxios-l10n
-git clone https://github.com/mozilla-l10n/firefoxios-l10n firefoxios-l10n || exit 1
+git clone "${L10N_REPO_URL:-https://github.com/mozilla-l10n/firefoxios-l10n}" firefoxios-l10n || exit 1
 cd firefoxios-l10n
-git checkout 76baab4264143f800e97311f587e03badb3269e5
+git checkout "${L10N_COMMIT:-76baab4264143f800e97311f587e03badb3269e5}"
 cd ..
 
 # Store current relative path to the script
@@ -77,20 +83,18 @@ then
     done
 fi
 
-# Clean up files (remove unwanted sections, map locale codes)
-${script_path}/update-xliff.py firefoxios-l10n firefox-ios.xliff || exit 1
-
-# Remove unwanted sections like Info.plist files and $(VARIABLES)
-${script_path}/xliff-cleanup.py firefoxios-l10n/*/*.xliff || exit 1
-
-# Export XLIFF files to individual .strings files
-rm -rf localized-strings || exit 1
-mkdir localized-strings || exit 1
+# Update locales from en-US (map locale codes), remove unwanted sections like
+# Info.plist files and $(VARIABLES) and export XLIFF files to individual
+# .strings files, in a single pass over each locale. The manifest lists the
+# files exported by the previous run, only locales that changed since then
+# are exported again.
+echo "Importing locales"
+mkdir -p localized-strings || exit 1
 if [ "${ignore_errors}" = true ]
 then
-    ${script_path}/xliff-to-strings.py firefoxios-l10n localized-strings --ignore-errors || exit 1
+    ${script_path}/import-locales.py --jobs $(getconf _NPROCESSORS_ONLN) --manifest localized-strings/manifest.json firefoxios-l10n localized-strings --ignore-errors || exit 1
 else
-    ${script_path}/xliff-to-strings.py firefoxios-l10n localized-strings || exit 1
+    ${script_path}/import-locales.py --jobs $(getconf _NPROCESSORS_ONLN) --manifest localized-strings/manifest.json firefoxios-l10n localized-strings || exit 1
 fi
 
 # Update: We have to disable this for v29 and above as we need to add multiple Target Membership to Today.strings but unfortunately that is not supported by mod_pbxproj in strings-import script.
@@ -0,0 +1,247 @@
+#! /usr/bin/env python
+
+#
+# import-locales.py <l10n_folder> <export_root>
+#
+# Run update-xliff.py, xliff-cleanup.py and xliff-to-strings.py on all
+# locales of l10n_folder in a single pass. Each locale file is read once,
+# updated from the en-US reference and cleaned up in memory, and its
+# .strings files are exported from the resulting tree. The en-US reference
+# is only cleaned up and exported.
+#
+# Locale files are left untouched unless --write-xliff is set, then they get
+# the same content the three scripts would write.
+#
+# --jobs, --ignore-errors, --source-root, --source-cache, --encoding,
+# --format, --engine and --manifest work as in xliff-to-strings.py. With
+# --manifest, a locale is also exported again when the reference changes.
+#
+
+import argparse
+import copy
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+
+from xliff_common import NS, indent, load_script, serialize
+
+REFERENCE_LOCALE = "en-US"
+XLIFF_FILENAME = "firefox-ios.xliff"
+
+
+update_xliff = load_script("update-xliff.py")
+xliff_cleanup = load_script("xliff-cleanup.py")
+xliff_to_strings = load_script("xliff-to-strings.py")
+
+
+def qualify_tags(root):
+    # update-xliff.py and xliff-cleanup.py add <target> elements without a
+    # namespace, which are in the XLIFF namespace once the file is written
+    # and parsed again. Do the same in memory, so that the next steps find
+    # them.
+    for node in list(root.iter("{}*")):
+        node.tag = "{%s}%s" % (NS["x"], node.tag)
+
+
+def import_locale(file_path, reference_template, rules, args, used_keys):
+    # Update, clean up and export a locale, returns a result dictionary like
+    # xliff-to-strings.py, with changed set if the XLIFF file changed.
+    result = xliff_to_strings.new_result(file_path)
+    result["changed"] = False
+    messages = result["messages"]
+    locale = file_path.split(os.sep)[-2]
+    try:
+        if locale == REFERENCE_LOCALE:
+            tree = copy.deepcopy(reference_template.tree)
+        else:
+            translations = update_xliff.read_translations(update_xliff.iter_translations(file_path))
+            locale_code = update_xliff.LOCALE_MAPPING.get(locale, locale)
+            tree, _ = reference_template.render(translations, locale_code)
+    except Exception as e:
+        messages.append("ERROR: Can't parse file %s" % file_path)
+        messages.append(str(e))
+        result["error"] = str(e)
+        return result
+
+    root = tree.getroot()
+    qualify_tags(root)
+    xliff_cleanup.cleanup(root, rules)
+    qualify_tags(root)
+
+    if args.write_xliff:
+        indent(root)
+        xliff_content = serialize(tree)
+        with open(file_path, "rb") as fp:
+            result["changed"] = fp.read() != xliff_content
+        if result["changed"]:
+            messages.append("  Updating {}".format(file_path))
+            update_xliff.replace_file(file_path, xliff_content)
+
+    return xliff_to_strings.export_tree(
+        tree, args.export_root, result, used_keys, args.encoding, args.format, args.engine)
+
+
+def config_digest(args, used_keys):
+    # Everything besides the locale and reference files that changes the
+    # strings files of a locale
+    config = {
+        "strings": xliff_to_strings.config_digest(args, used_keys),
+        "cleanup": xliff_cleanup.RULES,
+        "locale_mapping": update_xliff.LOCALE_MAPPING,
+    }
+    content = json.dumps(config, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(content).hexdigest()
+
+
+# State of a worker process, see init_worker()
+worker_state = None
+
+
+def init_worker(reference_file_path, args, used_keys):
+    global worker_state
+    worker_state = (update_xliff.ReferenceTemplate.load(reference_file_path),
+                    xliff_cleanup.compile_rules(), args, used_keys)
+
+
+def import_locale_worker(file_path):
+    return (file_path, import_locale(file_path, *worker_state))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("import_root", help="Path to folder including subfolders for all locales")
+    parser.add_argument("export_root", help="Path to folder used to export .strings files")
+    parser.add_argument("--write-xliff", action="store_true",
+                        help="Also write updated and cleaned up XLIFF files back to import_root")
+    parser.add_argument("--ignore-errors", action="store_true",
+                        help="Ignore parsing errors in localized XLIFF files")
+    parser.add_argument("--jobs", "-j", type=int, default=1,
+                        help="Number of locales to import in parallel (default: 1)")
+    parser.add_argument("--source-root",
+                        help="Path to the firefox-ios sources, only strings used by extensions "
+                             "are copied into their bundles")
+    parser.add_argument("--source-cache",
+                        help="JSON file used to cache the scan of Swift sources with --source-root")
+    parser.add_argument("--encoding", choices=["utf-8", "utf-16"], default="utf-8",
+                        help="Encoding of the .strings files (default: utf-8)")
+    parser.add_argument("--format", choices=["text", "binary"], default="text",
+                        help="Write text strings files, or binary plists without notes for "
+                             "release builds (default: text)")
+    parser.add_argument("--engine", choices=["python", "xslt"], default="python",
+                        help="Render text strings files in Python, or with an XSLT stylesheet "
+                             "(default: python)")
+    parser.add_argument("--manifest",
+                        help="JSON file recording the strings files exported for each locale, "
+                             "unchanged locales are skipped")
+    args = parser.parse_args()
+
+    if args.engine == "xslt" and args.format != "text":
+        parser.error("--engine xslt only renders text strings files")
+    if args.manifest and args.write_xliff:
+        parser.error("--manifest and --write-xliff are mutually exclusive, skipped locales "
+                     "wouldn't be written")
+
+    if not os.path.isdir(args.import_root):
+        print("import path does not exist or is not a directory")
+        sys.exit(1)
+
+    if not os.path.isdir(args.export_root):
+        print("export path does not exist or is not a directory")
+        sys.exit(1)
+
+    reference_file_path = os.path.join(args.import_root, REFERENCE_LOCALE, XLIFF_FILENAME)
+    if not os.path.isfile(reference_file_path):
+        print("Requested reference file doesn't exist: %s" % reference_file_path)
+        sys.exit(1)
+
+    used_keys = None
+    if args.source_root:
+        try:
+            used_keys = xliff_to_strings.find_used_keys(args.source_root, args.source_cache)
+        except xliff_to_strings.ProjectError as e:
+            print("ERROR: Can't find the sources of extensions: %s" % e)
+            sys.exit(1)
+
+    file_paths = sorted(glob.glob(os.path.join(args.import_root, "*", XLIFF_FILENAME)))
+
+    # Strings files of a locale depend on the locale file and the reference
+    manifest = None
+    digests = {}
+    if args.manifest:
+        manifest = xliff_to_strings.ExportManifest(args.manifest, config_digest(args, used_keys))
+        reference_digest = update_xliff.file_digest(reference_file_path)
+        for file_path in file_paths:
+            digest = reference_digest
+            if file_path != reference_file_path:
+                digest = hashlib.sha1(
+                    (reference_digest + update_xliff.file_digest(file_path)).encode("utf-8")).hexdigest()
+            digests[file_path] = digest
+        manifest.remove_missing(file_paths)
+        file_paths = [file_path for file_path in file_paths
+                      if not manifest.is_unchanged(file_path, digests[file_path])]
+
+    # Read the reference once, each locale is rendered from a copy
+    if file_paths:
+        try:
+            reference_template = update_xliff.ReferenceTemplate.load(reference_file_path)
+        except Exception as e:
+            print("ERROR: Can't parse reference %s file" % REFERENCE_LOCALE)
+            print(e)
+            sys.exit(1)
+
+    pool = None
+    if args.jobs > 1 and len(file_paths) > 1:
+        # Each worker parses the reference once when it starts. imap() keeps
+        # results in the same order as file_paths, so the output doesn't
+        # depend on scheduling.
+        pool = multiprocessing.Pool(
+            min(args.jobs, len(file_paths)), init_worker,
+            (reference_file_path, args, used_keys))
+        results = pool.imap(import_locale_worker, file_paths)
+    else:
+        rules = xliff_cleanup.compile_rules()
+        results = (
+            (file_path, import_locale(file_path, reference_template, rules, args, used_keys))
+            for file_path in file_paths
+        )
+
+    imported = 0
+    exported_files = 0
+    failed_paths = []
+    try:
+        for file_path, result in results:
+            for message in result["messages"]:
+                print(message)
+            sys.stdout.flush()
+            if result["error"] is not None:
+                failed_paths.append(file_path)
+                if not args.ignore_errors:
+                    break
+            else:
+                imported += 1
+                exported_files += result["files"]
+                if manifest is not None:
+                    manifest.update(file_path, digests[file_path], result["outputs"])
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if manifest is not None:
+            manifest.write()
+
+    print("Exported {} strings files for {} locales".format(exported_files, imported))
+    if manifest is not None and manifest.skipped:
+        print("Skipped {} unchanged locales".format(manifest.skipped))
+    if failed_paths:
+        print("Locales not imported because of errors:")
+        for file_path in failed_paths:
+            print("  {}".format(file_path))
+        if not args.ignore_errors:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#! /usr/bin/env python
+
+#
+# rewrite-originals.py <input_xliff> <output_xliff>
+#
+# Fix the paths of strings files in an XLIFF file exported by xcodebuild,
+# e.g. Blockzilla/en.lproj/Intro.strings becomes Blockzilla/Intro.strings.
+#
+# Only original attributes (the path of a <file> section) are rewritten,
+# everything else is copied as is. The file is read and written one line at
+# a time, with a single regular expression matching all paths in REWRITES.
+#
+
+import argparse
+import os
+import re
+
+# Paths to rewrite in original attributes, anywhere in the value
+REWRITES = {
+    # Focus
+    b"Blockzilla/en.lproj/Intro.strings": b"Blockzilla/Intro.strings",
+    b"Blockzilla/en.lproj/InfoPlist.strings": b"Blockzilla/InfoPlist.strings",
+    b"Blockzilla/en.lproj/Intents.strings": b"Blockzilla/Intents.strings",
+    b"ContentBlocker/en.lproj/InfoPlist.strings": b"ContentBlocker/InfoPlist.strings",
+    b"OpenInFocus/en.lproj/InfoPlist.strings": b"OpenInFocus/InfoPlist.strings",
+    # Lockwise
+    b"CredentialProvider/en.lproj/InfoPlist.strings": b"CredentialProvider/InfoPlist.strings",
+    b"CredentialProvider/en.lproj/Localizable.strings": b"CredentialProvider/Localizable.strings",
+    b"lockbox-ios/Common/Resources/en.lproj/InfoPlist.strings":
+        b"lockbox-ios/Common/Resources/InfoPlist.strings",
+    b"lockbox-ios/Common/Resources/Strings/en.lproj/Localizable.strings":
+        b"lockbox-ios/Common/Resources/Strings/Localizable.strings",
+    # Firefox
+    b"Shared/Supporting Files/Intro.strings": b"Client/Intro.strings",
+    b"Shared/Supporting Files/Storage.strings": b"Storage.strings",
+}
+
+ORIGINAL_RE = re.compile(br"""(\boriginal\s*=\s*)(["'])(.*?)\2""")
+
+# Longest paths first, so that a path is never hidden by a shorter one
+# starting at the same position
+REWRITE_RE = re.compile(b"|".join(
+    re.escape(path) for path in sorted(REWRITES, key=lambda path: (-len(path), path))))
+
+
+def rewrite_original(match):
+    value = REWRITE_RE.sub(lambda path: REWRITES[path.group(0)], match.group(3))
+    return match.group(1) + match.group(2) + value + match.group(2)
+
+
+def rewrite_file(input_path, output_path):
+    # Returns the number of lines with paths that changed. The output
+    # is written to a temporary file renamed at the end, so input and
+    # output can be the same file.
+    changed = 0
+    temp_path = output_path + ".tmp"
+    try:
+        with open(input_path, "rb") as input_fp, open(temp_path, "wb") as output_fp:
+            for line in input_fp:
+                if b"original" in line:
+                    new_line = ORIGINAL_RE.sub(rewrite_original, line)
+                    if new_line != line:
+                        changed += 1
+                        line = new_line
+                output_fp.write(line)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.rename(temp_path, output_path)
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input_xliff", help="XLIFF file exported by xcodebuild")
+    parser.add_argument("output_xliff", help="Path of the fixed XLIFF file, can be the same file")
+    args = parser.parse_args()
+
+    changed = rewrite_file(args.input_xliff, args.output_xliff)
+    print("Rewrote file paths on %d lines of %s" % (changed, args.output_xliff))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#
+# source_index.py
+#
+# Index of the localized strings used by Swift sources. xliff-to-strings.py
+# uses it to only copy into extension bundles the strings they use.
+#
+# Each Swift file is scanned for:
+#  - keys passed as literals to NSLocalizedString() or MZLocalizedString()
+#  - static constants defined with one of these calls, e.g.
+#    public static let SendToCancelButton = MZLocalizedString("SendTo.Cancel.Button", ...)
+#    Other variables defined this way count as direct uses of the key.
+#  - identifiers, to find which of these constants the file references
+#  - calls with a key that isn't a literal: strings used by these files can't
+#    be determined, so they can't be pruned
+#
+# Scan results are cached by file digest in a JSON file, so that only new or
+# modified files are scanned again.
+#
+
+import hashlib
+import json
+import os
+import re
+
+try:
+    unichr
+except NameError:
+    unichr = chr
+
+# Bump when the format of the cache or the scan changes
+CACHE_VERSION = 1
+
+LOCALIZED_STRING = r'(?<!func )\b(?:NS|MZ)LocalizedString\(\s*(?:key:\s*)?'
+STRING_LITERAL = r'"((?:[^"\\\n]|\\.)*)"'
+
+KEY_RE = re.compile(LOCALIZED_STRING + STRING_LITERAL)
+CONSTANT_RE = re.compile(
+    r'\bstatic\s+(?:let|var)\s+(\w+)\s*(?::\s*String\s*)?=\s*(' + LOCALIZED_STRING + ')' + STRING_LITERAL)
+DYNAMIC_RE = re.compile(LOCALIZED_STRING + r'(?![\s"]|key:)')
+WRAPPER_RE = re.compile(r'\bfunc\s+\w*LocalizedString\b')
+IDENTIFIER_RE = re.compile(r'\b[A-Za-z_]\w*\b')
+ESCAPE_RE = re.compile(r'\\(u\{([0-9a-fA-F]+)\}|.)')
+
+ESCAPES = {
+    '0': '\0',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+}
+
+
+def unescape(literal):
+    # Value of a Swift string literal, None if it contains interpolations
+    if '\\(' in literal:
+        return None
+
+    def replace(match):
+        if match.group(2):
+            return unichr(int(match.group(2), 16))
+        return ESCAPES.get(match.group(1), match.group(1))
+
+    return ESCAPE_RE.sub(replace, literal)
+
+
+def scan_source(text):
+    # Localized strings used by a Swift file, see the description at the top
+    # of the file.
+    constants = {}
+    definitions = set()
+    dynamic = False
+    for match in CONSTANT_RE.finditer(text):
+        key = unescape(match.group(3))
+        if key is None:
+            dynamic = True
+            continue
+        constants[match.group(1)] = key
+        definitions.add(match.start(2))
+
+    keys = set()
+    for match in KEY_RE.finditer(text):
+        if match.start() in definitions:
+            continue
+        key = unescape(match.group(1))
+        if key is None:
+            dynamic = True
+        else:
+            keys.add(key)
+
+    # Wrappers like MZLocalizedString() call NSLocalizedString() with their
+    # own parameter, those calls don't use any key by themselves.
+    if DYNAMIC_RE.search(text) and not WRAPPER_RE.search(text):
+        dynamic = True
+
+    references = set(IDENTIFIER_RE.findall(text)) - set(constants)
+    return {
+        'keys': sorted(keys),
+        'constants': constants,
+        'references': sorted(references),
+        'dynamic': dynamic,
+    }
+
+
+class SourceIndex(object):
+
+    def __init__(self, source_root, cache_path=None):
+        self.source_root = source_root
+        self.cache_path = cache_path
+        # {relative path: scan result}
+        self.files = {}
+        # Number of files scanned, and read from the cache
+        self.scanned = 0
+        self.cached = 0
+
+    def read_cache(self):
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path) as fp:
+                cache = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return {}
+        if not isinstance(cache, dict) or cache.get('version') != CACHE_VERSION:
+            return {}
+        return cache['files']
+
+    def write_cache(self):
+        if not self.cache_path:
+            return
+        temp_path = self.cache_path + '.tmp'
+        with open(temp_path, 'w') as fp:
+            json.dump({'version': CACHE_VERSION, 'files': self.files}, fp,
+                      sort_keys=True, separators=(',', ':'))
+        os.rename(temp_path, self.cache_path)
+
+    def build(self):
+        # Scan all Swift files in source_root, reusing cached results for
+        # files that didn't change
+        cache = self.read_cache()
+        for folder, folder_names, file_names in os.walk(self.source_root):
+            folder_names[:] = sorted(
+                folder_name for folder_name in folder_names if not folder_name.startswith('.'))
+            for file_name in file_names:
+                if not file_name.endswith('.swift'):
+                    continue
+                file_path = os.path.join(folder, file_name)
+                relative_path = os.path.relpath(file_path, self.source_root).replace(os.sep, '/')
+                with open(file_path, 'rb') as fp:
+                    content = fp.read()
+                digest = hashlib.sha1(content).hexdigest()
+                entry = cache.get(relative_path)
+                if entry is not None and entry['digest'] == digest:
+                    self.cached += 1
+                else:
+                    entry = scan_source(content.decode('utf-8', 'replace'))
+                    entry['digest'] = digest
+                    self.scanned += 1
+                self.files[relative_path] = entry
+        self.write_cache()
+
+    def used_keys(self, paths, folders=None):
+        # Keys used by the sources in paths, and in folders ({folder: paths
+        # excluded from it}), all relative to source_root, either directly
+        # or through constants defined anywhere. Returns None if some keys
+        # can't be determined.
+        constants = {}
+        for entry in self.files.values():
+            for name, key in entry['constants'].items():
+                constants.setdefault(name, set()).add(key)
+
+        paths = set(paths)
+        for folder, excluded in (folders or {}).items():
+            prefix = folder.rstrip('/') + '/'
+            paths.update(relative_path for relative_path in self.files
+                         if relative_path.startswith(prefix) and relative_path not in excluded)
+        keys = set()
+        for relative_path, entry in self.files.items():
+            if relative_path not in paths:
+                continue
+            if entry['dynamic']:
+                return None
+            keys.update(entry['keys'])
+            for name in entry['references']:
+                keys.update(constants.get(name, ()))
+        return frozenset(keys)
@@ -0,0 +1,229 @@
+#
+# translation_memory.py
+#
+# Local translation memory stored in a SQLite database. update-xliff.py
+# stores every translation it reads from locale files, and uses it to
+# recover translations of strings that moved to a different file or
+# changed id while keeping the same source text.
+#
+# Translations are stored per locale, indexed by the digest of the source
+# string and by (file, id).
+#
+# FuzzyIndex finds source strings similar to a given string, to suggest
+# translations for strings that changed slightly.
+#
+
+import bisect
+import collections
+import difflib
+import math
+import os
+import sqlite3
+
+# Maximum number of digests in a single query, SQLite limits the number of
+# variables in a statement to 999 by default.
+BATCH_SIZE = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS translations (
+    locale TEXT NOT NULL,
+    file TEXT NOT NULL,
+    id TEXT NOT NULL,
+    source_digest TEXT NOT NULL,
+    source TEXT,
+    target TEXT NOT NULL,
+    PRIMARY KEY (locale, file, id, source_digest)
+);
+CREATE INDEX IF NOT EXISTS translations_source_digest
+    ON translations (locale, source_digest);
+'''
+
+
+# Translations as read by queries: with a read-only memory, the database is
+# attached as "stored" and translations added during the run are kept in
+# memory, in front of the stored ones they replace
+MEMORY_VIEW = '''
+CREATE TEMP VIEW memory AS
+    SELECT 1 AS layer, rowid AS position, * FROM main.translations
+'''
+
+LAYERED_MEMORY_VIEW = MEMORY_VIEW + '''
+    UNION ALL
+    SELECT 0, rowid, * FROM stored.translations AS stored_translation
+    WHERE NOT EXISTS (
+        SELECT 1 FROM main.translations AS added
+        WHERE added.locale = stored_translation.locale
+          AND added.file = stored_translation.file
+          AND added.id = stored_translation.id
+          AND added.source_digest = stored_translation.source_digest
+    )
+'''
+
+
+class TranslationMemory(object):
+
+    def __init__(self, path, read_only=False):
+        if read_only:
+            # Nothing is written to the database (see --check in
+            # update-xliff.py), but lookups also find what was added since
+            self.connection = sqlite3.connect(':memory:')
+            self.connection.executescript(SCHEMA)
+            view = MEMORY_VIEW
+            if os.path.isfile(path):
+                self.connection.execute('ATTACH DATABASE ? AS stored', (path,))
+                if self.connection.execute(
+                        "SELECT 1 FROM stored.sqlite_master WHERE name = 'translations'").fetchone():
+                    view = LAYERED_MEMORY_VIEW
+            self.connection.execute(view)
+            return
+
+        # Several processes can share the same database (see --jobs in
+        # update-xliff.py), wait for locks instead of failing.
+        self.connection = sqlite3.connect(path, timeout=120)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(MEMORY_VIEW)
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, locale, units):
+        # Store (file, id, source_digest, source, target) tuples. Newer
+        # translations replace existing ones and get a higher rowid, which is
+        # used to prefer recent translations.
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)',
+                ((locale,) + unit for unit in units if unit[4] is not None)
+            )
+
+    def find_by_digests(self, locale, digests):
+        # Return {source_digest: [(file, id, target), ...]} for all stored
+        # translations of the given source digests, most recent first.
+        results = {}
+        digests = list(set(digests))
+        for start in range(0, len(digests), BATCH_SIZE):
+            batch = digests[start:start + BATCH_SIZE]
+            query = (
+                'SELECT source_digest, file, id, target FROM memory '
+                'WHERE locale = ? AND source_digest IN (%s) '
+                'ORDER BY layer DESC, position DESC' % ', '.join('?' * len(batch))
+            )
+            for row in self.connection.execute(query, [locale] + batch):
+                results.setdefault(row[0], []).append(row[1:])
+        return results
+
+    def find_by_locale(self, locale):
+        # Return all (file, id, source, target) stored for a locale
+        return self.connection.execute(
+            'SELECT file, id, source, target FROM memory '
+            'WHERE locale = ? ORDER BY file, id, layer, position', (locale,)
+        ).fetchall()
+
+
+class FuzzyIndex(object):
+    # Finds source strings similar to a query, with the same score as
+    # difflib's ratio(). The index keeps every source string it's given and
+    # the scores of each query, so an index shared by all locales of a run
+    # compares a changed string with each source string only once, even if
+    # most locales translated the same strings.
+    #
+    # Sources are only scored with difflib if they pass three upper bounds
+    # of the ratio, which can't drop a match: the lengths of both strings,
+    # the characters they have in common, and the length of their longest
+    # common subsequence (difflib's matching blocks are a common
+    # subsequence). The subsequence is computed with bit vectors, see
+    # lcs_length().
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        # Source strings, their character counts and the bit masks used by
+        # lcs_length(), in the order they were added
+        self.sources = []
+        self.histograms = []
+        self.masks = []
+        self.known = set()
+        # {length: [source index]}, indexes in increasing order
+        self.lengths = {}
+        # {query: (number of sources compared, {source: score})}
+        self.scores = {}
+
+    def add(self, source_strings):
+        for source_string in source_strings:
+            if not source_string or source_string in self.known:
+                continue
+            self.known.add(source_string)
+            masks = {}
+            for position, character in enumerate(source_string):
+                masks[character] = masks.get(character, 0) | (1 << position)
+            self.lengths.setdefault(len(source_string), []).append(len(self.sources))
+            self.sources.append(source_string)
+            self.histograms.append(collections.Counter(source_string))
+            self.masks.append(masks)
+
+    def similar(self, text):
+        # Return {source: score} for all sources added so far with a score
+        # of at least threshold. Only sources added since the last call for
+        # the same text are compared.
+        compared, matches = self.scores.get(text, (0, {}))
+        if compared == len(self.sources) or not text:
+            return matches
+
+        threshold = self.threshold
+        length = len(text)
+        histogram = collections.Counter(text).items()
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(text)
+        # ratio() is 2 * matches / total, with total the sum of lengths, so
+        # it's at most 2 * min(lengths) / total. Only sources with a length
+        # in that range can match.
+        shortest = int(math.floor(length * threshold / (2 - threshold)))
+        longest = int(math.ceil(length * (2 - threshold) / threshold))
+        indexes = []
+        for source_length in range(shortest, longest + 1):
+            bucket = self.lengths.get(source_length, ())
+            indexes.extend(bucket[bisect.bisect_left(bucket, compared):])
+        for index in indexes:
+            source_string = self.sources[index]
+            # Keep some margin for rounding errors
+            total = length + len(source_string)
+            minimum = threshold * total / 2.0 - 1e-9
+            if min(length, len(source_string)) < minimum:
+                continue
+            source_histogram = self.histograms[index]
+            shared = 0
+            for character, count in histogram:
+                shared += min(count, source_histogram.get(character, 0))
+            if shared < minimum:
+                continue
+            if lcs_length(text, self.masks[index], len(source_string)) < minimum:
+                continue
+            matcher.set_seq1(source_string)
+            score = matcher.ratio()
+            if score >= threshold:
+                matches[source_string] = round(score, 4)
+        self.scores[text] = (len(self.sources), matches)
+        return matches
+
+    def search(self, text, units, limit=3):
+        # Return up to limit (score, file, id, source, target) tuples from
+        # units, given as {source: [(file, id, target)]}, best first. Sources
+        # of units must have been added to the index.
+        results = []
+        for source_string, score in self.similar(text).items():
+            for file_name, string_id, target_string in units.get(source_string, ()):
+                results.append((score, file_name, string_id, source_string, target_string))
+        results.sort(key=lambda result: (-result[0], result[3], result[4], result[1], result[2]))
+        return results[:limit]
+
+
+def lcs_length(text, masks, length):
+    # Length of the longest common subsequence of text and a string of the
+    # given length, with masks mapping each of its characters to the bit
+    # mask of their positions (Hyyro's bit-parallel algorithm).
+    full = (1 << length) - 1
+    vector = full
+    for character in text:
+        matched = vector & masks.get(character, 0)
+        vector = ((vector + matched) | (vector - matched)) & full
+    return length - bin(vector).count('1')
@@ -7,39 +7,1241 @@
 #  1. Read existing translations, store them in an array: IDs use the structure
 #     file_name:string_id:source_hash. Using the hash of the source string
 #     prevent from keeping an existing translation if the ID doesn't change
-#     but the source string does.
+#     but the source string does. The hash is a SHA-1 digest, so it's stable
+#     between runs and can be stored in the index (see --index-dir).
 #
 #  2. Inject available translations in the reference XLIFF file, updating
 #     the target-language where available on file elements.
 #
 #  3. Store the updated content in existing locale files, without backup.
+#
+#  With --index-dir, a locale is skipped when neither the reference, the
+#  locale file nor the options changing the output (translation memory,
+#  fuzzy matching) changed since the last run.
+#
+#  With --patch, the previous reference is compared with the current one and
+#  only the trans-units that were added, removed or changed are updated in
+#  locale files.
+#
+#  With --translation-memory, translations read from locale files are stored
+#  in a SQLite database, and used for strings that moved to another file or
+#  changed id but kept the same source text.
+#
+#  With --fuzzy-report or --fuzzy-alt-trans, strings whose source changed
+#  since the locale was last updated get suggestions from translated strings
+#  with a similar source, in a JSON report or as <alt-trans> elements.
+#
+#  Locale files are only written if their content changed, through a
+#  temporary file renamed over the existing one. With --manifest, the list of
+#  changed locales is written to a file. With --check, locale files and
+#  indexes are left untouched, and the script exits with an error if any
+#  locale would change.
+#
+#  With --profile, the time spent in each phase (parsing, rendering,
+#  serialization...), element counts and memory usage are written to a JSON
+#  file for the reference and each locale, and the slowest phases and
+#  locales are printed at the end. Memory is the peak RSS of the run, and
+#  where /proc is available the largest RSS sampled in each phase and the
+#  growth of RSS while updating each locale.
+#
+#  With --watch, the script keeps running after the update: the reference
+#  and indexes stay in memory, and only locales whose file changed are
+#  updated again, or all of them (patched) if the reference changed.
 
 from glob import glob
 from lxml import etree
+from timeit import default_timer
 import argparse
+import contextlib
+import copy
+import hashlib
+import json
+import multiprocessing
 import os
+import resource
+import shutil
 import sys
+import time
 
+from translation_memory import FuzzyIndex, TranslationMemory
+from xliff_common import (NS, FILE_TAG, TRANS_UNIT_TAG, SOURCE_TAG, TARGET_TAG,
+                          file_index, indent, iterparse, parse, serialize, unit_index)
 
-NS = {'x':'urn:oasis:names:tc:xliff:document:1.2'}
+# Bump when the format of the translation index changes
+INDEX_VERSION = 1
 
+# Using locale folder as locale code. In some cases we need to map this
+# value to a different locale code
+# http://www.ibabbleon.com/iOS-Language-Codes-ISO-639.html
+# See Bug 1193530, Bug 1160467.
+LOCALE_MAPPING = {
+    'es-ES': 'es',
+    'ga-IE': 'ga',
+    'nb-NO': 'nb',
+    'nn-NO': 'nn',
+    'sv-SE': 'sv',
+    'tl'   : 'fil',
+    'zgh'  : 'tzm',
+    'sat'  : 'sat-Olck'
+}
 
-def indent(elem, level=0):
-    # Prettify XML output
-    # http://effbot.org/zone/element-lib.htm#prettyprint
-    i = '\n' + level*'  '
-    if len(elem):
-        if not elem.text or not elem.text.strip():
-            elem.text = i + '  '
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = i
-        for elem in elem:
-            indent(elem, level+1)
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = i
+
+def insert_node(parent, previous, node):
+    # Insert node after previous (or as first child if previous is None).
+    # Trees are already indented, so fix the whitespace around the new node
+    # instead of running indent() on the whole document again.
+    if previous is None:
+        if len(parent):
+            node.tail = parent.text
+        else:
+            level = len(list(parent.iterancestors()))
+            parent.text = '\n' + (level + 1)*'  '
+            node.tail = '\n' + level*'  '
+        parent.insert(0, node)
     else:
-        if level and (not elem.tail or not elem.tail.strip()):
-            elem.tail = i
+        node.tail = previous.tail
+        previous.tail = parent.text
+        previous.addnext(node)
+
+
+def insert_target(trans_node, text):
+    # Insert a target node after source
+    child = etree.Element('target')
+    child.text = text
+    insert_node(trans_node, trans_node[0], child)
+
+
+def insert_alt_trans(trans_node, suggestion):
+    # Add a fuzzy match as <alt-trans> at the end of the trans-unit
+    alt_trans = etree.Element('alt-trans')
+    alt_trans.set('match-quality', '%d' % round(suggestion['score'] * 100))
+    etree.SubElement(alt_trans, 'source').text = suggestion['source']
+    etree.SubElement(alt_trans, 'target').text = suggestion['target']
+    insert_node(trans_node, trans_node[-1], alt_trans)
+    # The trans-unit may not be in the document yet (see --patch), take the
+    # level from the indentation of its children
+    tail = alt_trans.tail
+    indent(alt_trans, (len(trans_node.text) - 1) // 2)
+    alt_trans.tail = tail
+
+
+def remove_node(node):
+    # The previous sibling takes over the tail of the removed node, which
+    # is what indent() would have produced.
+    previous = node.getprevious()
+    if previous is not None:
+        previous.tail = node.tail
+    node.getparent().remove(node)
+
+
+def replace_node(node, new_node):
+    new_node.tail = node.tail
+    node.getparent().replace(node, new_node)
+
+
+def unit_fingerprint(trans_node):
+    # Everything in a reference trans-unit except its targets, used to find
+    # units that changed between two versions of the reference.
+    return (
+        tuple(sorted(trans_node.attrib.items())),
+        tuple((child.tag, child.text) for child in trans_node if child.tag != TARGET_TAG)
+    )
+
+
+def file_fingerprint(file_node):
+    # Attributes and header of a <file>. The value of target-language is
+    # replaced by the locale code, only its presence matters.
+    attributes = dict(file_node.attrib)
+    if attributes.get('target-language'):
+        attributes['target-language'] = True
+    header = file_node.find('x:header', NS)
+    if header is not None:
+        header = etree.tostring(header, with_tail=False)
+    return (tuple(sorted(attributes.items())), header)
+
+
+def peak_rss(who=resource.RUSAGE_SELF):
+    # Peak resident set size of the current process, or of the largest
+    # terminated child process, in KiB (ru_maxrss is in bytes on macOS)
+    rss = resource.getrusage(who).ru_maxrss
+    if sys.platform == 'darwin':
+        rss //= 1024
+    return rss
+
+
+def current_rss():
+    # Current resident set size of the process in KiB, None where
+    # /proc/self/statm isn't available (e.g. macOS)
+    try:
+        with open('/proc/self/statm') as fp:
+            pages = int(fp.read().split()[1])
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+    return pages * resource.getpagesize() // 1024
+
+
+class Profile(object):
+    # Wall time spent in each phase of a task, and counts of processed
+    # elements. Phases can be nested: time spent in the inner phase isn't
+    # counted in the outer one. The resident set size is sampled at each
+    # phase boundary: each phase records the largest sample taken while it
+    # was the current one, and the task the growth from its start.
+
+    def __init__(self):
+        self.started = default_timer()
+        self.last = self.started
+        self.stack = []
+        self.phases = {}
+        self.counts = {}
+        self.start_rss = current_rss()
+        self.max_rss = self.start_rss
+        self.phase_rss = {}
+
+    def charge(self):
+        # Add the time since the last call to the current phase
+        now = default_timer()
+        rss = None if self.start_rss is None else current_rss()
+        if self.stack:
+            name = self.stack[-1]
+            self.phases[name] = self.phases.get(name, 0) + now - self.last
+            if rss is not None:
+                self.phase_rss[name] = max(self.phase_rss.get(name, 0), rss)
+        if rss is not None:
+            self.max_rss = max(self.max_rss, rss)
+        self.last = now
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        self.charge()
+        self.stack.append(name)
+        try:
+            yield
+        finally:
+            self.charge()
+            self.stack.pop()
+
+    def count(self, name, value):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def report(self):
+        # rss_growth_kb and phase_rss_kb are None without current_rss(). The
+        # peak RSS of the process is only known for the whole run, see
+        # build_profile_report().
+        self.charge()
+        growth = None
+        phase_rss = None
+        if self.start_rss is not None:
+            growth = self.max_rss - self.start_rss
+            phase_rss = self.phase_rss
+        return {
+            'seconds': round(default_timer() - self.started, 6),
+            'phases': dict((name, round(seconds, 6)) for name, seconds in self.phases.items()),
+            'counts': self.counts,
+            'rss_growth_kb': growth,
+            'phase_rss_kb': phase_rss,
+        }
+
+
+class ReferenceTemplate(object):
+    # Reference XLIFF parsed and indented once, then rendered for each
+    # locale. Every trans-unit in the reference becomes a slot storing its
+    # translation key and everything that doesn't depend on the locale, so
+    # rendering only needs a copy of the pristine tree and a walk over
+    # trans-units in document order.
+
+    def __init__(self, reference_tree, digest=None, profile=None):
+        self.tree = reference_tree
+        self.digest = digest
+        profile = profile or Profile()
+        reference_root = reference_tree.getroot()
+        with profile.phase('reference indent'):
+            indent(reference_root)
+
+        self.slots = []
+        # Pristine trans-unit nodes, in the same order as slots
+        self.nodes = []
+        # List of (file_name, file_node) and {file_name: [(id, slot index)]}
+        self.files = []
+        self.file_nodes = {}
+        self.file_units = {}
+        self.unit_slots = {}
+        with profile.phase('reference slots'):
+            for file_node in reference_root.iter(FILE_TAG):
+                file_name = file_node.get('original')
+                self.files.append((file_name, file_node))
+                self.file_nodes[file_name] = file_node
+                units = self.file_units.setdefault(file_name, [])
+                for trans_node in file_node.iter(TRANS_UNIT_TAG):
+                    source_string = trans_node.find('x:source', NS).text
+                    original_id = trans_node.get('id')
+                    digest = source_digest(source_string)
+                    string_id = '%s:%s:%s' % (file_name, original_id, digest)
+                    has_target = trans_node.find('x:target', NS) is not None
+
+                    # Try to "autotranslate" CFBundle* if there's no translation.
+                    # Skip if CFBundleDisplayName contains an actual string.
+                    autotranslate = original_id.startswith('CFBundle') and not (
+                        original_id == 'CFBundleDisplayName' and not source_string.startswith('$('))
+
+                    self.unit_slots[(file_name, original_id)] = len(self.slots)
+                    units.append((original_id, len(self.slots)))
+                    self.slots.append((string_id, file_name, original_id, source_string, digest,
+                                       has_target, autotranslate))
+                    self.nodes.append(trans_node)
+        profile.count('reference units', len(self.slots))
+
+    @classmethod
+    def load(cls, reference_file_path, profile=None):
+        profile = profile or Profile()
+        with profile.phase('reference parse'):
+            reference_tree = parse(reference_file_path)
+        return cls(reference_tree, file_digest(reference_file_path), profile)
+
+    def has_unit(self, file_name, original_id, digest):
+        slot_index = self.unit_slots.get((file_name, original_id))
+        return slot_index is not None and self.slots[slot_index][4] == digest
+
+    def fill_unit(self, slot_index, trans_node, translations, rendered, alternatives=None):
+        # Inject the available translation in a copy of the reference
+        # trans-unit at slot_index, store the resulting target in rendered.
+        # alternatives maps slot indexes to fuzzy matches added as alt-trans.
+        string_id, _, original_id, source_string, _, has_target, autotranslate = self.slots[slot_index]
+        translated = string_id in translations
+        if has_target:
+            for child in trans_node.findall('x:target', NS):
+                if translated:
+                    # Translation is available, update the target
+                    # If it's a CFBundleShortVersionString, keep the source
+                    if original_id == 'CFBundleShortVersionString':
+                        child.text = source_string
+                    else:
+                        child.text = translations[string_id]
+                    rendered[string_id] = child.text
+                else:
+                    # No translation available, remove the target
+                    remove_node(child)
+        elif translated:
+            # Translation is available, but reference has no target.
+            # Create a target node and insert it after source.
+            insert_target(trans_node, translations[string_id])
+            rendered[string_id] = translations[string_id]
+
+        if not translated and autotranslate:
+            insert_target(trans_node, source_string)
+            rendered[string_id] = source_string
+
+        if alternatives and slot_index in alternatives:
+            for suggestion in alternatives[slot_index]:
+                insert_alt_trans(trans_node, suggestion)
+
+    def render(self, translations, locale_code, alternatives=None):
+        # Returns the rendered tree, and the translations it contains keyed
+        # like the ones read from a locale file.
+        tree = copy.deepcopy(self.tree)
+        root = tree.getroot()
+        rendered = {}
+
+        # Inject available translations
+        for slot_index, trans_node in enumerate(root.iter(TRANS_UNIT_TAG)):
+            self.fill_unit(slot_index, trans_node, translations, rendered, alternatives)
+
+        # Update target-language where defined
+        for file_node in root.iter(FILE_TAG):
+            set_target_language(file_node, locale_code)
+
+        return (tree, rendered)
+
+    def render_unit(self, slot_index, translations, rendered, alternatives=None):
+        trans_node = copy.deepcopy(self.nodes[slot_index])
+        self.fill_unit(slot_index, trans_node, translations, rendered, alternatives)
+        return trans_node
+
+    def render_file(self, file_name, translations, locale_code, rendered, alternatives=None):
+        file_node = copy.deepcopy(self.file_nodes[file_name])
+        slot_indexes = [slot_index for _, slot_index in self.file_units[file_name]]
+        for slot_index, trans_node in zip(slot_indexes, file_node.iter(TRANS_UNIT_TAG)):
+            self.fill_unit(slot_index, trans_node, translations, rendered, alternatives)
+        set_target_language(file_node, locale_code)
+        return file_node
+
+
+def set_target_language(file_node, locale_code):
+    # Update target-language where defined
+    if file_node.get('target-language'):
+        file_node.set('target-language', locale_code)
+
+
+class ReferenceDelta(object):
+    # Differences between two versions of the reference, compared by
+    # (file original, id) and the content of each trans-unit. Each entry of
+    # ops is a tuple starting with the operation:
+    #
+    #   ('add-file', file_name, previous_file_name)
+    #   ('remove-file', file_name)
+    #   ('update-file', file_name)     attributes or header changed
+    #   ('replace-file', file_name)    units were reordered
+    #   ('reorder-files', None)        sections were reordered, always last
+    #   ('add', file_name, id, previous_id)
+    #   ('remove', file_name, id)
+    #   ('change', file_name, id)
+    #
+    # previous_file_name and previous_id are None when the new node comes
+    # first in its parent.
+
+    def __init__(self, previous, current):
+        self.previous = previous
+        self.current = current
+        self.ops = []
+
+        for file_name, _ in previous.files:
+            if file_name not in current.file_nodes:
+                self.ops.append(('remove-file', file_name))
+
+        previous_file_name = None
+        for file_name, file_node in current.files:
+            if file_name not in previous.file_nodes:
+                self.ops.append(('add-file', file_name, previous_file_name))
+            else:
+                if file_fingerprint(file_node) != file_fingerprint(previous.file_nodes[file_name]):
+                    self.ops.append(('update-file', file_name))
+                self.ops.extend(self.diff_units(file_name))
+            previous_file_name = file_name
+
+        # Sections found in both references but in a different order are
+        # moved once all other ops are applied
+        previous_order = [file_name for file_name, _ in previous.files
+                          if file_name in current.file_nodes]
+        current_order = [file_name for file_name, _ in current.files
+                         if file_name in previous.file_nodes]
+        if previous_order != current_order:
+            self.ops.append(('reorder-files', None))
+
+        # Slots of the current reference rendered when patching, and the
+        # ones among them whose (file, id) had a different source in the
+        # previous reference
+        self.rendered_slots = []
+        for op in self.ops:
+            if op[0] in ('add-file', 'replace-file'):
+                self.rendered_slots.extend(
+                    slot_index for _, slot_index in current.file_units[op[1]])
+            elif op[0] in ('add', 'change'):
+                self.rendered_slots.append(current.unit_slots[(op[1], op[2])])
+        self.changed_slots = []
+        for slot_index in self.rendered_slots:
+            _, file_name, original_id, _, digest, _, _ = current.slots[slot_index]
+            previous_index = previous.unit_slots.get((file_name, original_id))
+            if previous_index is not None and previous.slots[previous_index][4] != digest:
+                self.changed_slots.append(slot_index)
+
+    def diff_units(self, file_name):
+        previous_units = self.previous.file_units[file_name]
+        current_units = self.current.file_units[file_name]
+        previous_ids = dict(previous_units)
+        current_ids = dict(current_units)
+
+        # Units that moved around can't be patched one by one, replace the
+        # whole section. Same for duplicated ids.
+        if (len(previous_ids) != len(previous_units) or
+                len(current_ids) != len(current_units) or
+                [i for i, _ in previous_units if i in current_ids] !=
+                [i for i, _ in current_units if i in previous_ids]):
+            return [('replace-file', file_name)]
+
+        ops = []
+        for original_id, _ in previous_units:
+            if original_id not in current_ids:
+                ops.append(('remove', file_name, original_id))
+
+        previous_id = None
+        for original_id, slot_index in current_units:
+            if original_id not in previous_ids:
+                ops.append(('add', file_name, original_id, previous_id))
+            elif (unit_fingerprint(self.current.nodes[slot_index]) !=
+                    unit_fingerprint(self.previous.nodes[previous_ids[original_id]])):
+                ops.append(('change', file_name, original_id))
+            previous_id = original_id
+
+        return ops
+
+    def patch(self, locale_tree, locale_code, rendered, recover=None):
+        # Apply ops to a locale tree generated from the previous reference.
+        # rendered is the translation table of the locale file, it's updated
+        # to match the patched tree. recover, if defined, is called with the
+        # (file, id, source, target) tuples read from units that are about
+        # to be removed or replaced, the translations available, the slots
+        # that will be rendered, the ones whose source changed and a function
+        # returning all translated units of the locale, and returns fuzzy
+        # matches to add as alt-trans. Returns False if the locale doesn't match the previous
+        # reference and needs a full update instead.
+        locale_files = file_index(locale_tree.getroot())
+        if set(locale_files) != set(self.previous.file_nodes):
+            return False
+
+        # Trans-units of the locale by id, only for the sections we touch
+        locale_units = {}
+
+        def get_units(file_name):
+            if file_name not in locale_units:
+                units = dict((original_id, trans_node) for (_, original_id), trans_node
+                             in unit_index(locale_files[file_name]).items())
+                if set(units) != set(dict(self.previous.file_units[file_name])):
+                    raise LookupError(file_name)
+                locale_units[file_name] = units
+            return locale_units[file_name]
+
+        # Read translations of units that are removed or replaced, and drop
+        # them from rendered.
+        translations = {}
+        read_units = []
+        try:
+            for op in self.ops:
+                action, file_name = op[0], op[1]
+                if action in ('remove-file', 'replace-file'):
+                    trans_nodes = get_units(file_name).values()
+                elif action in ('remove', 'change'):
+                    trans_nodes = [get_units(file_name)[op[2]]]
+                else:
+                    continue
+                for trans_node in trans_nodes:
+                    original_id = trans_node.get('id')
+                    source_string = trans_node.find('x:source', NS).text
+                    string_id = translation_key(file_name, original_id, source_string)
+                    rendered.pop(string_id, None)
+                    for child in trans_node.findall('x:target', NS):
+                        translations[string_id] = child.text
+                        read_units.append((file_name, original_id, source_string, child.text))
+        except LookupError:
+            return False
+
+        alternatives = None
+        if recover is not None:
+            alternatives = recover(read_units, translations, self.rendered_slots, self.changed_slots,
+                                   lambda: list(tree_translations(locale_tree.getroot())))
+
+        for op in self.ops:
+            action, file_name = op[0], op[1]
+            if action == 'remove-file':
+                remove_node(locale_files.pop(file_name))
+            elif action == 'add-file':
+                file_node = self.current.render_file(
+                    file_name, translations, locale_code, rendered, alternatives)
+                previous_file_name = op[2]
+                if previous_file_name is None:
+                    # Insert before the first existing <file>
+                    first = next(locale_tree.getroot().iter(FILE_TAG), None)
+                    previous_node = first.getprevious() if first is not None else None
+                    insert_node(locale_tree.getroot(), previous_node, file_node)
+                else:
+                    previous_node = locale_files[previous_file_name]
+                    insert_node(previous_node.getparent(), previous_node, file_node)
+                locale_files[file_name] = file_node
+            elif action == 'replace-file':
+                file_node = self.current.render_file(
+                    file_name, translations, locale_code, rendered, alternatives)
+                replace_node(locale_files[file_name], file_node)
+                locale_files[file_name] = file_node
+            elif action == 'update-file':
+                self.update_file(locale_files[file_name], file_name, locale_code)
+            elif action == 'reorder-files':
+                self.reorder_files(locale_tree.getroot(), locale_files)
+            else:
+                units = get_units(file_name)
+                original_id = op[2]
+                if action == 'remove':
+                    remove_node(units.pop(original_id))
+                    continue
+
+                slot_index = self.current.unit_slots[(file_name, original_id)]
+                trans_node = self.current.render_unit(slot_index, translations, rendered, alternatives)
+                if action == 'change':
+                    replace_node(units[original_id], trans_node)
+                else:
+                    previous_id = op[3]
+                    if previous_id is None:
+                        body_node = locale_files[file_name].find('x:body', NS)
+                        insert_node(body_node, None, trans_node)
+                    else:
+                        previous_node = units[previous_id]
+                        insert_node(previous_node.getparent(), previous_node, trans_node)
+                units[original_id] = trans_node
+
+        # Parsing drops the tail indent() gives to the root element
+        locale_tree.getroot().tail = self.current.tree.getroot().tail
+
+        return True
+
+    def reorder_files(self, root, locale_files):
+        # Put <file> nodes in the order of the current reference. Each node
+        # takes the position and tail of the one it replaces, so the
+        # indentation doesn't change.
+        nodes = [locale_files[file_name] for file_name, _ in self.current.files]
+        positions = sorted(root.index(node) for node in nodes)
+        tails = [root[position].tail for position in positions]
+        for node in nodes:
+            root.remove(node)
+        for position, node, tail in zip(positions, nodes, tails):
+            node.tail = tail
+            root.insert(position, node)
+
+    def update_file(self, file_node, file_name, locale_code):
+        # Copy attributes and header of the reference <file>
+        reference_node = self.current.file_nodes[file_name]
+        file_node.attrib.clear()
+        for name, value in reference_node.attrib.items():
+            file_node.set(name, value)
+        set_target_language(file_node, locale_code)
+
+        header = file_node.find('x:header', NS)
+        reference_header = reference_node.find('x:header', NS)
+        if header is not None:
+            remove_node(header)
+        if reference_header is not None:
+            insert_node(file_node, None, copy.deepcopy(reference_header))
+
+
+def read_unit(trans_node):
+    # Source and targets of a trans-unit, only looking at direct children
+    source_string = None
+    target_strings = []
+    for child in trans_node:
+        if child.tag == SOURCE_TAG:
+            if source_string is None:
+                source_string = child.text
+        elif child.tag == TARGET_TAG:
+            target_strings.append(child.text)
+    return source_string, target_strings
+
+
+def iter_translations(file_path, seen_units=None):
+    # Stream (file_name, string_id, source_string, target_string) for each
+    # trans-unit with a target. Elements are cleared as soon as they've been
+    # read, so memory doesn't grow with the size of the locale file. If
+    # seen_units is a dictionary, (file_name, string_id) of all trans-units,
+    # translated or not, are added to it with their source string.
+    file_name = None
+    context = iterparse(file_path, events=('start', 'end'), tag=(FILE_TAG, TRANS_UNIT_TAG))
+    for event, elem in context:
+        if elem.tag == FILE_TAG:
+            if event == 'start':
+                file_name = elem.get('original')
+            else:
+                elem.clear()
+                elem.getparent().remove(elem)
+            continue
+
+        if event == 'end':
+            source_string, target_strings = read_unit(elem)
+            if seen_units is not None:
+                seen_units[(file_name, elem.get('id'))] = source_string
+            for target_string in target_strings:
+                yield (file_name, elem.get('id'), source_string, target_string)
+
+            # Drop the trans-unit and the ones already processed before it
+            elem.clear()
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+
+
+def tree_translations(root):
+    # Same tuples as iter_translations() for a parsed document
+    file_name = None
+    for node in root.iter(FILE_TAG, TRANS_UNIT_TAG):
+        if node.tag == FILE_TAG:
+            file_name = node.get('original')
+            continue
+        source_string, target_strings = read_unit(node)
+        for target_string in target_strings:
+            yield (file_name, node.get('id'), source_string, target_string)
+
+
+def source_digest(source_string):
+    # Stable digest of a source string, used in translation keys instead of
+    # hash() so that keys can be stored and compared between runs.
+    if source_string is None:
+        source_string = ''
+    return hashlib.sha1(source_string.encode('utf-8')).hexdigest()
+
+
+def translation_key(file_name, string_id, source_string):
+    return '%s:%s:%s' % (file_name, string_id, source_digest(source_string))
+
+
+def file_digest(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_translations(units):
+    # Store existing localizations from (file, id, source, target) tuples
+    translations = {}
+    for file_name, string_id, source_string, target_string in units:
+        translations[translation_key(file_name, string_id, source_string)] = target_string
+
+    return translations
+
+
+def get_index_path(index_dir, file_path):
+    # One index per locale and XLIFF file: <index_dir>/<locale>/<xliff>.json
+    parts = file_path.split(os.sep)
+    return os.path.join(index_dir, parts[-2], parts[-1] + '.json')
+
+
+def options_digest(fuzzy_threshold, fuzzy_alt_trans, memory):
+    # Digest of the options that change the content of locale files:
+    # suggestions added as alt-trans and translations recovered from a
+    # translation memory. fuzzy_threshold is None without fuzzy matching.
+    options = {
+        'version': INDEX_VERSION,
+        'fuzzy_threshold': fuzzy_threshold,
+        'fuzzy_alt_trans': fuzzy_alt_trans,
+        'translation_memory': memory,
+    }
+    return hashlib.sha1(json.dumps(options, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def read_index(index_path):
+    # The index records the digest of the reference and of the locale file
+    # produced by the last update, the options it was produced with (see
+    # options_digest()) and the translations stored in that file. Returns
+    # None if there's no usable index.
+    try:
+        with open(index_path) as fp:
+            index = json.load(fp)
+    except (IOError, OSError, ValueError):
+        return None
+    if not isinstance(index, dict) or index.get('version') != INDEX_VERSION:
+        return None
+    return index
+
+
+def write_index(index_path, index):
+    index_folder = os.path.dirname(index_path)
+    if not os.path.isdir(index_folder):
+        os.makedirs(index_folder)
+    replace_file(index_path, json.dumps(index, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+
+
+def replace_file(file_path, content):
+    # Write content to a temporary file next to file_path, then rename it:
+    # an interrupted run never leaves a truncated file behind.
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as fp:
+        fp.write(content)
+    if os.path.exists(file_path):
+        shutil.copymode(file_path, temp_path)
+    os.rename(temp_path, file_path)
+
+
+def recover_translations(memory, locale, reference_template, slot_indexes, translations):
+    # Look up untranslated units in the translation memory by source digest.
+    # Only translations stored for a unit that is no longer in the reference
+    # are used: those are strings that moved to another file or changed id,
+    # while identical strings used in different places keep being translated
+    # separately. Recovered translations are added to translations, returns
+    # the list of (file_name, id) recovered.
+    missing = []
+    for slot_index in slot_indexes:
+        slot = reference_template.slots[slot_index]
+        if slot[0] not in translations:
+            missing.append(slot)
+    if not missing:
+        return []
+
+    found = memory.find_by_digests(locale, [slot[4] for slot in missing])
+    recovered = []
+    for string_id, file_name, original_id, _, digest, _, _ in missing:
+        candidates = [
+            candidate for candidate in found.get(digest, [])
+            if not reference_template.has_unit(candidate[0], candidate[1], digest)
+        ]
+        if not candidates:
+            continue
+        # Prefer translations with the same id, then the most recent one
+        same_id = [candidate for candidate in candidates if candidate[1] == original_id]
+        translations[string_id] = (same_id or candidates)[0][2]
+        recovered.append((file_name, original_id))
+
+    return recovered
+
+
+def find_suggestions(fuzzy_index, reference_template, slot_indexes, translations, units):
+    # Fuzzy matches for untranslated units among the translated units, given
+    # as (file, id, source, target) tuples, as {slot_index: [suggestion]}
+    slot_indexes = [
+        slot_index for slot_index in slot_indexes
+        if reference_template.slots[slot_index][0] not in translations
+    ]
+    if not slot_indexes:
+        return {}
+
+    # Same source and target in several places are only suggested once
+    candidates = {}
+    seen = set()
+    for file_name, original_id, source_string, target_string in units:
+        if not source_string or target_string is None:
+            continue
+        if (source_string, target_string) in seen:
+            continue
+        seen.add((source_string, target_string))
+        candidates.setdefault(source_string, []).append((file_name, original_id, target_string))
+    fuzzy_index.add(candidates)
+
+    suggestions = {}
+    for slot_index in slot_indexes:
+        source_string = reference_template.slots[slot_index][3]
+        matches = fuzzy_index.search(source_string, candidates)
+        if matches:
+            suggestions[slot_index] = [
+                {
+                    'score': score,
+                    'file': file_name,
+                    'id': original_id,
+                    'source': match_source,
+                    'target': match_target,
+                }
+                for score, file_name, original_id, match_source, match_target in matches
+            ]
+    return suggestions
+
+
+class LocaleUpdater(object):
+    # Update locale files from a reference template, using the optional
+    # index, delta, translation memory and fuzzy matching set on the
+    # command line. In check mode, locale files, indexes and the translation
+    # memory are not written.
+
+    def __init__(self, reference_template, index_dir=None, delta=None, memory=None,
+                 fuzzy_threshold=None, fuzzy_alt_trans=False, check=False):
+        self.reference_template = reference_template
+        self.index_dir = index_dir
+        self.delta = delta
+        self.memory = memory
+        # Fuzzy matching is disabled if fuzzy_threshold is None. The index
+        # is shared by all locales, see FuzzyIndex.
+        self.fuzzy_threshold = fuzzy_threshold
+        self.fuzzy_index = None
+        if fuzzy_threshold is not None:
+            self.fuzzy_index = FuzzyIndex(fuzzy_threshold)
+        self.fuzzy_alt_trans = fuzzy_alt_trans
+        self.check = check
+        # Indexes kept in memory by file path (see --watch), None to only
+        # use the index folder
+        self.indexes = None
+        # Options changing the content of locale files, a locale is only
+        # skipped if its index was written with the same ones
+        self.options_digest = options_digest(fuzzy_threshold, fuzzy_alt_trans, memory is not None)
+
+    @classmethod
+    def from_args(cls, reference_template, args):
+        delta = None
+        if args.patch:
+            delta = ReferenceDelta(ReferenceTemplate.load(args.patch), reference_template)
+        memory = None
+        if args.translation_memory:
+            memory = TranslationMemory(args.translation_memory, read_only=args.check)
+        fuzzy_threshold = None
+        if args.fuzzy_report or args.fuzzy_alt_trans:
+            fuzzy_threshold = args.fuzzy_threshold
+        return cls(reference_template, args.index_dir, delta, memory,
+                   fuzzy_threshold, args.fuzzy_alt_trans, args.check)
+
+    def has_index(self):
+        return bool(self.index_dir) or self.indexes is not None
+
+    def load_index(self, file_path):
+        if self.indexes is not None and file_path in self.indexes:
+            return self.indexes[file_path]
+        if self.index_dir:
+            return read_index(get_index_path(self.index_dir, file_path))
+        return None
+
+    def store_index(self, file_path, index):
+        if self.indexes is not None:
+            self.indexes[file_path] = index
+        if self.index_dir:
+            write_index(get_index_path(self.index_dir, file_path), index)
+
+    def remember(self, locale, units):
+        # Store (file, id, source, target) tuples in the translation memory.
+        # In check mode the memory is opened read-only and only keeps them
+        # for this run, so recovered translations are the same as in a
+        # normal run.
+        self.memory.add(locale, [
+            (file_name, string_id, source_digest(source_string), source_string, target_string)
+            for file_name, string_id, source_string, target_string in units
+        ])
+
+    def update(self, file_path):
+        # Merge translations from file_path into the reference and replace
+        # the file if its content changed. If a delta from the previous
+        # reference is available, only apply the differences to the existing
+        # file. Returns a result dictionary with:
+        #  - status: 'updated', 'patched', 'skipped' or 'failed'
+        #  - changed: True if the content of the file changed
+        #  - messages: list of lines to display
+        #  - suggestions: list of fuzzy matches for untranslated units
+        #  - profile: time spent in each phase and element counts
+        profile = Profile()
+        result = self.merge(file_path, profile)
+        result['profile'] = profile.report()
+        return result
+
+    def merge(self, file_path, profile):
+        reference_template = self.reference_template
+        delta = self.delta
+        index = None
+        if self.has_index():
+            with profile.phase('index'):
+                index = self.load_index(file_path)
+
+        locale = file_path.split(os.sep)[-2]
+        locale_code = LOCALE_MAPPING.get(locale, locale)
+        result = {
+            'status': 'skipped',
+            'changed': False,
+            'messages': [],
+            'suggestions': [],
+        }
+
+        # Strings recovered from the translation memory, fuzzy matches
+        recovered = []
+        suggestions = {}
+
+        def recover(units, translations, slot_indexes, fuzzy_slot_indexes, read_all_units=None):
+            # units are (file, id, source, target) tuples read from the
+            # locale, slot_indexes are the units that may have moved and
+            # fuzzy_slot_indexes the ones whose source changed. Fuzzy matches
+            # come from all translated units of the locale, returned by
+            # read_all_units if units only has some of them.
+            if self.memory is not None:
+                with profile.phase('translation memory'):
+                    self.remember(locale, units)
+                    recovered.extend(recover_translations(
+                        self.memory, locale, reference_template, slot_indexes, translations))
+            if self.fuzzy_threshold is None:
+                return None
+
+            with profile.phase('fuzzy matching'):
+                if read_all_units is not None:
+                    units = read_all_units()
+                # Previous versions of strings are in the translation memory
+                if self.memory is not None:
+                    units = units + self.memory.find_by_locale(locale)
+                suggestions.update(find_suggestions(
+                    self.fuzzy_index, reference_template, fuzzy_slot_indexes,
+                    translations, units))
+            return suggestions if self.fuzzy_alt_trans else None
+
+        def failed(message, error):
+            result['status'] = 'failed'
+            result['messages'].extend([message % file_path, str(error)])
+            return result
+
+        # Read existing translations from the localized XML file. If the file
+        # is still the output of the last run, the index already has them,
+        # and if the reference didn't change either there's nothing to do.
+        # Errors of the translation memory and fuzzy matching are reported
+        # apart from parse errors.
+        messages = result['messages']
+        updated_tree = None
+        alternatives = None
+        locale_tree = None
+        try:
+            translations = None
+            patchable = delta is not None and not self.has_index()
+            up_to_date = False
+            if index and index.get('options') == self.options_digest:
+                with profile.phase('index'):
+                    up_to_date = index['output'] == file_digest(file_path)
+            if up_to_date:
+                if index['reference'] == reference_template.digest:
+                    return result
+                patchable = delta is not None and index['reference'] == delta.previous.digest
+                # The translation memory and fuzzy matching need to know
+                # which units are in the file, the index only has
+                # translations.
+                if patchable or (self.memory is None and self.fuzzy_threshold is None):
+                    translations = index['translations']
+
+            if patchable:
+                # Without an index, trust that the locale was generated from
+                # the previous reference, patch() checks that ids match.
+                if not delta.ops:
+                    return result
+                with profile.phase('parse'):
+                    locale_tree = parse(file_path)
+        except Exception as e:
+            return failed("ERROR: Can't parse %s", e)
+
+        if locale_tree is not None:
+            updated_translations = dict(translations or {})
+            profile.count('patch operations', len(delta.ops))
+            try:
+                with profile.phase('patch'):
+                    patched = delta.patch(locale_tree, locale_code, updated_translations, recover)
+            except Exception as e:
+                return failed("ERROR: Can't update %s", e)
+            if patched:
+                updated_tree = locale_tree
+            else:
+                messages.append("  Locale doesn't match the previous reference, running a full update")
+                del recovered[:]
+                suggestions.clear()
+
+        if updated_tree is None and translations is None:
+            seen_units = {}
+            try:
+                with profile.phase('parse'):
+                    units = iter_translations(file_path, seen_units)
+                    if self.memory is not None or self.fuzzy_threshold is not None:
+                        units = list(units)
+                    translations = read_translations(units)
+            except Exception as e:
+                return failed("ERROR: Can't parse %s", e)
+            profile.count('locale units', len(seen_units))
+            # Only new units can be strings that moved, fuzzy matches are
+            # searched for units whose source changed.
+            try:
+                alternatives = recover(units, translations, [
+                    slot_index
+                    for slot_index, slot in enumerate(reference_template.slots)
+                    if (slot[1], slot[2]) not in seen_units
+                ], [
+                    slot_index
+                    for slot_index, slot in enumerate(reference_template.slots)
+                    if seen_units.get((slot[1], slot[2]), slot[3]) != slot[3]
+                ])
+            except Exception as e:
+                return failed("ERROR: Can't update %s", e)
+
+        if updated_tree is None:
+            result['status'] = 'updated'
+            profile.count('reference units', len(reference_template.slots))
+            with profile.phase('render'):
+                updated_tree, updated_translations = reference_template.render(
+                    translations, locale_code, alternatives)
+        else:
+            result['status'] = 'patched'
+
+        profile.count('translations', len(updated_translations))
+        profile.count('recovered', len(recovered))
+        profile.count('suggestions', len(suggestions))
+        if recovered:
+            messages.append('  Recovered %d translations from the translation memory:' % len(recovered))
+            for file_name, string_id in recovered:
+                messages.append('    %s: %s' % (file_name, string_id))
+
+        for slot_index in sorted(suggestions):
+            _, file_name, original_id, source_string, _, _, _ = reference_template.slots[slot_index]
+            result['suggestions'].append({
+                'file': file_name,
+                'id': original_id,
+                'source': source_string,
+                'matches': suggestions[slot_index],
+            })
+        if suggestions:
+            messages.append('  Found fuzzy matches for %d untranslated strings' % len(suggestions))
+
+        # Replace the existing locale file with the new XML content, only if
+        # it changed: unchanged files keep their modification time.
+        with profile.phase('serialize'):
+            xliff_content = serialize(updated_tree)
+        profile.count('output bytes', len(xliff_content))
+        with profile.phase('write'):
+            try:
+                with open(file_path, 'rb') as fp:
+                    result['changed'] = fp.read() != xliff_content
+            except (IOError, OSError):
+                result['changed'] = True
+            if not result['changed']:
+                messages.append('  No changes')
+            elif not self.check:
+                replace_file(file_path, xliff_content)
+
+            if self.has_index() and not self.check:
+                self.store_index(file_path, {
+                    'version': INDEX_VERSION,
+                    'reference': reference_template.digest,
+                    'output': hashlib.sha1(xliff_content).hexdigest(),
+                    'options': self.options_digest,
+                    'translations': updated_translations,
+                })
+
+        return result
+
+
+# Locale updater of a worker process, see init_worker()
+worker_updater = None
+
+
+def init_worker(reference_file_path, args):
+    global worker_updater
+    worker_updater = LocaleUpdater.from_args(ReferenceTemplate.load(reference_file_path), args)
+
+
+def update_locale_worker(file_path):
+    return (file_path, worker_updater.update(file_path))
+
+
+def report_results(results):
+    # Print messages for (file_path, result) as they come in, return the
+    # lists of paths that failed and changed, the fuzzy matches and the
+    # profiles by locale.
+    failed_paths = []
+    changed_paths = []
+    suggestions = {}
+    profiles = {}
+    skipped = 0
+    for file_path, result in results:
+        status = result['status']
+        if status == 'skipped':
+            skipped += 1
+        elif status == 'patched':
+            print('Patching %s' % file_path)
+        else:
+            print('Updating %s' % file_path)
+        for message in result['messages']:
+            print(message)
+        if status == 'failed':
+            failed_paths.append(file_path)
+        if result['changed']:
+            changed_paths.append(file_path)
+        locale = file_path.split(os.sep)[-2]
+        if result['suggestions']:
+            suggestions[locale] = result['suggestions']
+        profiles[locale] = dict(result['profile'], status=status)
+        sys.stdout.flush()
+
+    if skipped:
+        print('Skipped %d unchanged locales.' % skipped)
+
+    return (failed_paths, changed_paths, suggestions, profiles)
+
+
+def build_profile_report(run_profile, locale_profiles):
+    # Combine the profile of the main process (reference and overall time)
+    # with the profiles of each locale. Locale phases are summed in
+    # locale_phases, with --jobs their total can exceed the run time, and
+    # locale_phase_rss_kb has the largest RSS sampled in each of them.
+    report = run_profile.report()
+    report['peak_rss_kb'] = max(peak_rss(), peak_rss(resource.RUSAGE_CHILDREN))
+    report['locales'] = locale_profiles
+    locale_phases = {}
+    locale_phase_rss = {}
+    for locale_profile in locale_profiles.values():
+        for name, seconds in locale_profile['phases'].items():
+            locale_phases[name] = locale_phases.get(name, 0) + seconds
+        for name, rss in (locale_profile['phase_rss_kb'] or {}).items():
+            locale_phase_rss[name] = max(locale_phase_rss.get(name, 0), rss)
+    report['locale_phases'] = dict(
+        (name, round(seconds, 6)) for name, seconds in locale_phases.items())
+    report['locale_phase_rss_kb'] = locale_phase_rss
+    return report
+
+
+def print_profile_report(report, limit=10):
+    # Summary of the slowest phases and locales
+    phases = dict(report['phases'])
+    phases.update(report['locale_phases'])
+    phase_rss = dict(report['phase_rss_kb'] or {})
+    phase_rss.update(report['locale_phase_rss_kb'])
+    total = sum(phases.values()) or 1
+    print('')
+    print('Profile: %.3fs, peak RSS %d KiB' % (report['seconds'], report['peak_rss_kb']))
+    print('  %-24s %10s %7s %12s' % ('Phase', 'Seconds', 'Share', 'Max RSS KiB'))
+    for name, seconds in sorted(phases.items(), key=lambda item: (-item[1], item[0])):
+        print('  %-24s %10.3f %6.1f%% %12s' % (
+            name, seconds, 100.0 * seconds / total, phase_rss.get(name, '-')))
+
+    locales = sorted(report['locales'].items(), key=lambda item: (-item[1]['seconds'], item[0]))
+    if not locales:
+        return
+    print('  %-24s %10s %-9s %12s %s' % (
+        'Slowest locales', 'Seconds', 'Status', 'RSS +KiB', 'Slowest phase'))
+    for locale, locale_profile in locales[:limit]:
+        slowest = ''
+        if locale_profile['phases']:
+            name, seconds = max(locale_profile['phases'].items(), key=lambda item: (item[1], item[0]))
+            slowest = '%s (%.3fs)' % (name, seconds)
+        growth = locale_profile['rss_growth_kb']
+        print('  %-24s %10.3f %-9s %12s %s' % (
+            locale, locale_profile['seconds'], locale_profile['status'],
+            '-' if growth is None else growth, slowest))
+
+
+def file_signature(file_path):
+    # Modification time and size of a file, None if it doesn't exist
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def watch(updater, reference_file_path, file_paths, interval):
+    # Poll the reference and locale files every interval seconds, and merge
+    # again the locales that changed since the last update. When the
+    # reference changes, all locales are patched with the differences from
+    # the previous one, using the indexes kept in memory. Runs until
+    # interrupted.
+    if updater.indexes is None:
+        updater.indexes = {}
+    signatures = dict(
+        (file_path, file_signature(file_path))
+        for file_path in [reference_file_path] + file_paths
+    )
+    print('Watching %d locales for changes, press Ctrl+C to stop' % len(file_paths))
+    sys.stdout.flush()
+    while True:
+        time.sleep(interval)
+        changed_paths = [
+            file_path for file_path in sorted(signatures)
+            if file_signature(file_path) != signatures[file_path]
+        ]
+        if not changed_paths:
+            continue
+        for file_path in changed_paths:
+            signatures[file_path] = file_signature(file_path)
+
+        if reference_file_path in changed_paths:
+            try:
+                reference_template = ReferenceTemplate.load(reference_file_path)
+            except Exception as e:
+                print("ERROR: Can't parse reference file %s" % reference_file_path)
+                print(e)
+                sys.stdout.flush()
+                continue
+            updater.delta = ReferenceDelta(updater.reference_template, reference_template)
+            updater.reference_template = reference_template
+            print('Reference changed, changes from previous reference: %d' % len(updater.delta.ops))
+            changed_paths = file_paths
+        else:
+            changed_paths = [file_path for file_path in changed_paths if file_path in file_paths]
+
+        def update(file_path):
+            # Keep watching whatever happens with a single locale
+            try:
+                return updater.update(file_path)
+            except Exception as e:
+                return {
+                    'status': 'failed',
+                    'changed': False,
+                    'messages': ["ERROR: Can't update %s" % file_path, str(e)],
+                    'suggestions': [],
+                    'profile': Profile().report(),
+                }
+
+        failed_paths = report_results(
+            (file_path, update(file_path)) for file_path in changed_paths)[0]
+        for file_path in failed_paths:
+            print('Locale not updated because of errors: %s' % file_path)
+        # Files written by the update shouldn't trigger another one
+        for file_path in changed_paths:
+            signatures[file_path] = file_signature(file_path)
+        sys.stdout.flush()
 
 
 def main():
@@ -52,7 +1254,47 @@ def main():
     parser.add_argument('base_folder', help='Path to folder including subfolders for all locales')
     parser.add_argument('xliff_filename', help='Name of the XLIFF file to process')
     parser.add_argument('locales', nargs='*', help='Locales to process')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='Number of locales to update in parallel (default: 1)')
+    parser.add_argument('--index-dir',
+                        help='Folder used to store a translation index for each locale. '
+                             'Locales are skipped if neither the reference nor the '
+                             'locale file changed since the last run')
+    parser.add_argument('--patch', metavar='PREVIOUS_REFERENCE',
+                        help='Path to the previous version of the reference XLIFF file. '
+                             'Only the differences with the current reference are '
+                             'applied to locale files')
+    parser.add_argument('--translation-memory', metavar='DATABASE',
+                        help='SQLite database used as translation memory, to recover '
+                             'translations of strings that moved to a different file '
+                             'or changed id')
+    parser.add_argument('--fuzzy-report', metavar='JSON_FILE',
+                        help='Write fuzzy matches for untranslated strings to a JSON file')
+    parser.add_argument('--fuzzy-alt-trans', action='store_true',
+                        help='Add fuzzy matches for untranslated strings as <alt-trans> elements')
+    parser.add_argument('--fuzzy-threshold', type=float, default=0.75,
+                        help='Minimum similarity of fuzzy matches, greater than 0 and at most 1 '
+                             '(default: 0.75)')
+    parser.add_argument('--manifest', metavar='TEXT_FILE',
+                        help='Write the list of locales whose file changed, one per line')
+    parser.add_argument('--check', action='store_true',
+                        help="Don't write locale files, exit with an error if any of "
+                             "them would change")
+    parser.add_argument('--profile', metavar='JSON_FILE',
+                        help='Write the time spent in each phase, element counts and peak '
+                             'memory usage for each locale to a JSON file, and print a '
+                             'summary')
+    parser.add_argument('--watch', action='store_true',
+                        help='After updating all locales, keep the reference in memory and '
+                             'update locales again when their file or the reference changes')
+    parser.add_argument('--watch-interval', type=float, default=1.0, metavar='SECONDS',
+                        help='Interval between checks for changes with --watch (default: 1)')
     args = parser.parse_args()
+    if args.watch and args.check:
+        parser.error('--watch and --check are mutually exclusive')
+    if not 0 < args.fuzzy_threshold <= 1:
+        parser.error('--fuzzy-threshold must be greater than 0 and at most 1')
+    run_profile = Profile()
 
     # Get a list of files to update (absolute paths)
     base_folder = os.path.realpath(args.base_folder)
@@ -84,107 +1326,84 @@ def main():
     else:
         file_paths.sort()
 
-    for file_path in file_paths:
-        print('Updating %s' % file_path)
-
-        # Read reference XML file
+    # Read reference XML file once, each locale is rendered from a copy
+    if file_paths:
         try:
-            reference_tree = etree.parse(reference_file_path)
-            reference_root = reference_tree.getroot()
+            reference_template = ReferenceTemplate.load(reference_file_path, run_profile)
         except Exception as e:
             print("ERROR: Can't parse reference %s file" % reference_locale)
             print(e)
             sys.exit(1)
 
-        # Read localized XML file
+    if file_paths:
         try:
-            locale_tree = etree.parse(file_path)
-            locale_root = locale_tree.getroot()
+            updater = LocaleUpdater.from_args(reference_template, args)
         except Exception as e:
-            print("ERROR: Can't parse %s" % file_path)
+            print("ERROR: Can't load previous reference or translation memory")
             print(e)
-            continue
+            sys.exit(1)
+        if updater.delta is not None:
+            print('Changes from previous reference: %d' % len(updater.delta.ops))
+        if args.watch:
+            # Indexes of locales updated in this process stay in memory
+            updater.indexes = {}
 
-        # Using locale folder as locale code. In some cases we need to map this
-        # value to a different locale code
-        # http://www.ibabbleon.com/iOS-Language-Codes-ISO-639.html
-        # See Bug 1193530, Bug 1160467.
-        locale_code = file_path.split(os.sep)[-2]
-        locale_mapping = {
-            'es-ES': 'es',
-            'ga-IE': 'ga',
-            'nb-NO': 'nb',
-            'nn-NO': 'nn',
-            'sv-SE': 'sv',
-            'tl'   : 'fil',
-            'zgh'  : 'tzm',
-            'sat'  : 'sat-Olck'
-        }
-        if locale_code in locale_mapping:
-            locale_code = locale_mapping[locale_code]
+    if args.jobs > 1 and len(file_paths) > 1:
+        # Each worker parses the reference once when it starts, tasks only
+        # carry the path of the locale file. imap() keeps results in the
+        # same order as file_paths, so the output doesn't depend on
+        # scheduling.
+        pool = multiprocessing.Pool(
+                    min(args.jobs, len(file_paths)),
+                    init_worker,
+                    (reference_file_path, args)
+                )
+        try:
+            results = pool.imap(update_locale_worker, file_paths)
+            failed_paths, changed_paths, suggestions, profiles = report_results(results)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = (
+            (file_path, updater.update(file_path))
+            for file_path in file_paths
+        )
+        failed_paths, changed_paths, suggestions, profiles = report_results(results)
 
-        # Store existing localizations
-        translations = {}
-        for trans_node in locale_root.xpath('//x:trans-unit', namespaces=NS):
-            for child in trans_node.xpath('./x:target', namespaces=NS):
-                file_name = trans_node.getparent().getparent().get('original')
-                source_string = trans_node.xpath('./x:source', namespaces=NS)[0].text
-                string_id = '%s:%s:%s' % (file_name, trans_node.get('id'), hash(source_string))
-                translations[string_id] = child.text
-
-        # Inject available translations in the reference XML
-        for trans_node in reference_root.xpath('//x:trans-unit', namespaces=NS):
-            file_name = trans_node.getparent().getparent().get('original')
-            source_string = trans_node.xpath('./x:source', namespaces=NS)[0].text
-            original_id = trans_node.get('id')
-            string_id = '%s:%s:%s' % (file_name, original_id, hash(source_string))
-            updated = False
-            translated = string_id in translations
-            for child in trans_node.xpath('./x:target', namespaces=NS):
-                if translated:
-                    # Translation is available, update the target
-                    # If it's a CFBundleShortVersionString, keep the source
-                    if original_id == 'CFBundleShortVersionString':
-                        child.text = source_string
-                    else:
-                        child.text = translations[string_id]
-                else:
-                    # No translation available, remove the target
-                    child.getparent().remove(child)
-                updated = True
-
-            if translated and not updated:
-                # Translation is available, but reference has no target.
-                # Create a target node and insert it after source.
-                child = etree.Element('target')
-                child.text = translations[string_id]
-                trans_node.insert(1, child)
-
-            # Try to "autotranslate" CFBundle*
-            if not translated and original_id.startswith('CFBundle'):
-                # Skip if CFBundleDisplayName contains an actual string
-                if original_id == 'CFBundleDisplayName' and not source_string.startswith('$('):
-                    continue
-                child = etree.Element('target')
-                child.text = source_string
-                trans_node.insert(1, child)
+    if args.fuzzy_report and file_paths:
+        with open(args.fuzzy_report, 'w') as fp:
+            json.dump(suggestions, fp, indent=2, sort_keys=True)
 
-        # Update target-language where defined
-        for file_node in reference_root.xpath('//x:file', namespaces=NS):
-            if file_node.get('target-language'):
-                file_node.set('target-language', locale_code)
+    if args.manifest:
+        with open(args.manifest, 'w') as fp:
+            for file_path in changed_paths:
+                fp.write(file_path.split(os.sep)[-2] + '\n')
 
-        # Replace the existing locale file with the new XML content
-        with open(file_path, 'w') as fp:
-            # Fix indentations
-            indent(reference_root)
-            xliff_content = etree.tostring(
-                                reference_tree,
-                                encoding='UTF-8',
-                                xml_declaration=True,
-                                pretty_print=True
-                            )
-            fp.write(xliff_content)
+    if args.profile:
+        run_profile.count('locales', len(file_paths))
+        report = build_profile_report(run_profile, profiles)
+        with open(args.profile, 'w') as fp:
+            json.dump(report, fp, indent=2, sort_keys=True)
+        print_profile_report(report)
+
+    if failed_paths:
+        print('Locales not updated because of errors:')
+        for file_path in failed_paths:
+            print('  %s' % file_path)
+
+    if args.check and (changed_paths or failed_paths):
+        if changed_paths:
+            print('Locales that would change:')
+            for file_path in changed_paths:
+                print('  %s' % file_path)
+        sys.exit(1)
+
+    if args.watch and file_paths:
+        try:
+            watch(updater, reference_file_path, file_paths, args.watch_interval)
+        except KeyboardInterrupt:
+            print('Stopped watching')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,208 @@
+#
+# xcode_project.py
+#
+# Read-only access to the targets of an Xcode project. xliff-to-strings.py
+# uses it to find the Swift sources built into each extension.
+#
+# project.pbxproj is an OpenStep plist: {} are dictionaries of key = value;
+# pairs, () are lists of values delimited by commas, and strings are quoted
+# or bare words. mod_pbxproj.py needs plutil, which is only available on
+# macOS, so the file is parsed here.
+#
+# The sources of a target are the files of its Sources build phase and the
+# folders synchronized with it (Xcode 16), with those of the targets it
+# depends on, e.g. the Shared framework for an extension. Swift packages
+# aren't part of the project and are left out.
+#
+
+import posixpath
+import re
+
+TOKEN_RE = re.compile(
+    r'\s+|//[^\n]*|/\*.*?\*/|"((?:[^"\\]|\\.)*)"|([\w$+\-./:]+)|(<[^>]*>)|([{}();=,])',
+    re.S)
+ESCAPE_RE = re.compile(r'\\(U[0-9a-fA-F]{4}|.)')
+
+try:
+    unichr
+except NameError:
+    unichr = chr
+
+ESCAPES = {
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+}
+
+
+class ProjectError(Exception):
+    pass
+
+
+def unescape(literal):
+    def replace(match):
+        escape = match.group(1)
+        if len(escape) == 5:
+            return unichr(int(escape[1:], 16))
+        return ESCAPES.get(escape, escape)
+
+    return ESCAPE_RE.sub(replace, literal)
+
+
+def tokenize(text):
+    # List of (kind, value) with kind 'string' or 'punctuation'
+    tokens = []
+    position = 0
+    while position < len(text):
+        match = TOKEN_RE.match(text, position)
+        if match is None:
+            raise ProjectError('unexpected character at offset %d' % position)
+        position = match.end()
+        quoted, word, data, punctuation = match.groups()
+        if quoted is not None:
+            tokens.append(('string', unescape(quoted)))
+        elif word is not None or data is not None:
+            tokens.append(('string', word or data))
+        elif punctuation is not None:
+            tokens.append(('punctuation', punctuation))
+    return tokens
+
+
+def parse_plist(text):
+    tokens = tokenize(text)
+    position = [0]
+
+    def next_token():
+        if position[0] >= len(tokens):
+            raise ProjectError('unexpected end of file')
+        token = tokens[position[0]]
+        position[0] += 1
+        return token
+
+    def expect(punctuation):
+        token = next_token()
+        if token != ('punctuation', punctuation):
+            raise ProjectError('expected %r, got %r' % (punctuation, token[1]))
+
+    def value():
+        kind, token = next_token()
+        if kind == 'string':
+            return token
+        if token == '{':
+            result = {}
+            while tokens[position[0]] != ('punctuation', '}'):
+                kind, key = next_token()
+                if kind != 'string':
+                    raise ProjectError('expected a key, got %r' % key)
+                expect('=')
+                result[key] = value()
+                expect(';')
+            next_token()
+            return result
+        if token == '(':
+            result = []
+            while tokens[position[0]] != ('punctuation', ')'):
+                result.append(value())
+                if tokens[position[0]] != ('punctuation', ')'):
+                    expect(',')
+            next_token()
+            return result
+        raise ProjectError('unexpected %r' % token)
+
+    try:
+        result = value()
+    except IndexError:
+        raise ProjectError('unexpected end of file')
+    if position[0] != len(tokens):
+        raise ProjectError('unexpected content after the root dictionary')
+    return result
+
+
+class XcodeProject(object):
+
+    def __init__(self, path):
+        # path is the project.pbxproj file, paths of sources are relative to
+        # the folder of the .xcodeproj bundle
+        self.path = path
+        try:
+            with open(path, 'rb') as fp:
+                plist = parse_plist(fp.read().decode('utf-8'))
+        except (IOError, OSError) as e:
+            raise ProjectError("can't read %s: %s" % (path, e))
+        except ProjectError as e:
+            raise ProjectError("can't parse %s: %s" % (path, e))
+        if not isinstance(plist, dict) or not isinstance(plist.get('objects'), dict):
+            raise ProjectError('%s is not an Xcode project' % path)
+        self.objects = plist['objects']
+        self.parents = {}
+        for object_id, obj in self.objects.items():
+            for child_id in obj.get('children', []):
+                self.parents[child_id] = object_id
+
+    def targets(self):
+        # {name: object id} of all native targets
+        return dict((obj['name'], object_id) for object_id, obj in self.objects.items()
+                    if obj.get('isa') == 'PBXNativeTarget')
+
+    def object_path(self, object_id):
+        # Path of a file reference or group relative to the source root,
+        # None for files outside of it (SDK, built products...)
+        obj = self.objects[object_id]
+        path = obj.get('path', '')
+        source_tree = obj.get('sourceTree', '<group>')
+        if source_tree == 'SOURCE_ROOT':
+            return posixpath.normpath(path)
+        if source_tree != '<group>':
+            return None
+        parent_id = self.parents.get(object_id)
+        if parent_id is None:
+            return posixpath.normpath(path) if path else ''
+        parent_path = self.object_path(parent_id)
+        if parent_path is None:
+            return None
+        return posixpath.normpath(posixpath.join(parent_path, path))
+
+    def target_sources(self, name):
+        # (files, folders): paths of the source files of target name and of
+        # the targets it depends on, and of the synchronized folders whose
+        # files are all built, with the files excluded from them
+        targets = self.targets()
+        if name not in targets:
+            raise ProjectError('no target %s in %s' % (name, self.path))
+        files = set()
+        folders = {}
+        pending = [targets[name]]
+        seen = set()
+        while pending:
+            target_id = pending.pop()
+            if target_id in seen:
+                continue
+            seen.add(target_id)
+            target = self.objects[target_id]
+            for phase_id in target.get('buildPhases', []):
+                phase = self.objects[phase_id]
+                if phase.get('isa') != 'PBXSourcesBuildPhase':
+                    continue
+                for build_file_id in phase.get('files', []):
+                    file_id = self.objects[build_file_id].get('fileRef')
+                    if file_id is None:
+                        continue
+                    path = self.object_path(file_id)
+                    if path is not None:
+                        files.add(path)
+            for group_id in target.get('fileSystemSynchronizedGroups', []):
+                path = self.object_path(group_id)
+                if path is None:
+                    continue
+                excluded = set()
+                for exception_id in self.objects[group_id].get('exceptions', []):
+                    exception = self.objects[exception_id]
+                    if exception.get('target') == target_id:
+                        excluded.update(posixpath.join(path, exception_path)
+                                        for exception_path in exception.get('membershipExceptions', []))
+                folders[path] = folders.get(path, excluded) & excluded
+            for dependency_id in target.get('dependencies', []):
+                dependency_target = self.objects[dependency_id].get('target')
+                if dependency_target is not None:
+                    pending.append(dependency_target)
+        return sorted(files), folders
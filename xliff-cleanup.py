@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 
 #
-# xliff-cleanup.py <files>
+# xliff-cleanup.py [--stream] <files>
 #
 #  1. Remove all <file> sections that we do not care about. We only care
 #     about the one for our main app and those for our extensions.
@@ -15,103 +15,216 @@
 #  4. Remove all remaining <file> sections that now have no <trans-unit>
 #     nodes in their <body> anymore.
 #
+# The rules are described in RULES, and all of them are applied in a single
+# walk over the document.
+#
+# With --stream, documents are read and written one <file> section at a time
+# instead of being loaded in memory.
+#
 # Modifies files in place. Makes no backup.
 #
 
-import sys
+import argparse
+import os
 
 from lxml import etree
 
-NS = {'x':'urn:oasis:names:tc:xliff:document:1.2'}
-
-def indent(elem, level=0):
-    # Prettify XML output
-    # http://effbot.org/zone/element-lib.htm#prettyprint
-    i = '\n' + level*'  '
-    if len(elem):
-        if not elem.text or not elem.text.strip():
-            elem.text = i + '  '
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = i
-        for elem in elem:
-            indent(elem, level+1)
-        if not elem.tail or not elem.tail.strip():
-            elem.tail = i
-    else:
-        if level and (not elem.tail or not elem.tail.strip()):
-            elem.tail = i
-
-files_to_keep = [
-    'Client/Info.plist',
-    'Extensions/Today/Info.plist'
-]
-
-strings_to_remove = [
-    'CFBundleDisplayName',
-    'CFBundleName',
-    'CFBundleShortVersionString'
-]
-
-required_ids = [
-    'NSCameraUsageDescription',
-    'NSLocationWhenInUseUsageDescription',
-    'NSMicrophoneUsageDescription',
-    'NSPhotoLibraryAddUsageDescription',
-    'ShortcutItemTitleNewPrivateTab',
-    'ShortcutItemTitleNewTab',
-    'ShortcutItemTitleQRCode',
-]
+from xliff_common import NS, FILE_TAG, TRANS_UNIT_TAG, indent, iterparse, parse, serialize
+
+XML_DECLARATION = b"<?xml version='1.0' encoding='UTF-8'?>\n"
+
+# Cleanup rules, compiled once by compile_rules() and applied to each file
+# by cleanup():
+#  - scoped_suffixes: rules only apply to <file> sections whose original
+#    attribute ends with one of these suffixes.
+#  - files_to_keep: scoped <file> sections that are kept, all others are
+#    removed.
+#  - strings_to_remove: ids of strings removed from scoped <file> sections,
+#    except for (file, id) pairs listed in strings_to_keep.
+#  - required_ids: strings (in any file) that get the English source as
+#    target if there's no translation.
+#  Scoped <file> sections without strings are removed.
+RULES = {
+    'scoped_suffixes': [
+        'Info.plist',
+    ],
+    'files_to_keep': [
+        'Client/Info.plist',
+        'Extensions/Today/Info.plist',
+    ],
+    'strings_to_remove': [
+        'CFBundleDisplayName',
+        'CFBundleName',
+        'CFBundleShortVersionString',
+    ],
+    'strings_to_keep': [
+        ('Extensions/SendTo/Info.plist', 'CFBundleDisplayName'),
+        ('Extensions/ViewLater/Info.plist', 'CFBundleDisplayName'),
+    ],
+    'required_ids': [
+        'NSCameraUsageDescription',
+        'NSLocationWhenInUseUsageDescription',
+        'NSMicrophoneUsageDescription',
+        'NSPhotoLibraryAddUsageDescription',
+        'ShortcutItemTitleNewPrivateTab',
+        'ShortcutItemTitleNewTab',
+        'ShortcutItemTitleQRCode',
+    ],
+}
+
+# Actions for <file> sections
+KEEP_FILE = 0
+REMOVE_FILE = 1
+SCOPED_FILE = 2
+
+
+class CleanupRules(object):
+    # Rules compiled into sets and dictionaries, so that the cost of a
+    # lookup doesn't depend on the number of rules.
+
+    def __init__(self, rules):
+        self.scoped_suffixes = tuple(rules['scoped_suffixes'])
+        self.files_to_keep = frozenset(rules['files_to_keep'])
+        self.required_ids = frozenset(rules['required_ids'])
+        # {file: set of ids to remove}, file is None for the default
+        self.strings_to_remove = {None: frozenset(rules['strings_to_remove'])}
+        for file_name, string_id in rules['strings_to_keep']:
+            ids = self.strings_to_remove.get(file_name, self.strings_to_remove[None])
+            self.strings_to_remove[file_name] = ids - frozenset([string_id])
+        # Action by file name, filled as file names are encountered
+        self.file_actions = {}
+
+    def file_action(self, file_name):
+        action = self.file_actions.get(file_name)
+        if action is None:
+            if not file_name or not file_name.endswith(self.scoped_suffixes):
+                action = KEEP_FILE
+            elif file_name in self.files_to_keep:
+                action = SCOPED_FILE
+            else:
+                action = REMOVE_FILE
+            self.file_actions[file_name] = action
+        return action
+
+    def ids_to_remove(self, file_name):
+        return self.strings_to_remove.get(file_name, self.strings_to_remove[None])
+
+
+def compile_rules(rules=RULES):
+    return CleanupRules(rules)
+
+
+def cleanup_file(file_node, rules):
+    # Apply compiled rules to a <file> section in a single walk over its
+    # trans-units: remove strings we don't want and copy English in required
+    # strings. Returns False if the whole section should be removed.
+    file_name = file_node.get('original')
+    action = rules.file_action(file_name)
+    if action == REMOVE_FILE:
+        return False
+
+    ids_to_remove = rules.ids_to_remove(file_name) if action == SCOPED_FILE else ()
+    remaining = 0
+    for trans_node in list(file_node.iter(TRANS_UNIT_TAG)):
+        original_id = trans_node.get('id')
+        if original_id in ids_to_remove:
+            trans_node.getparent().remove(trans_node)
+            continue
+        remaining += 1
+
+        # Copy English in required strings if there's no translation
+        if original_id in rules.required_ids and trans_node.find('x:target', NS) is None:
+            child = etree.Element('target')
+            child.text = trans_node.find('x:source', NS).text
+            trans_node.insert(1, child)
+
+    # Scoped sections without strings are removed
+    return action != SCOPED_FILE or remaining > 0
+
+
+def cleanup(root, rules):
+    for file_node in list(root.iter(FILE_TAG)):
+        if not cleanup_file(file_node, rules):
+            file_node.getparent().remove(file_node)
+
+
+def cleanup_tree(path, rules):
+    # Read the whole document, clean it up and write it back
+    tree = parse(path)
+    root = tree.getroot()
+    cleanup(root, rules)
+    indent(root)
+    with open(path, 'wb') as fp:
+        fp.write(serialize(tree))
+
+
+def cleanup_stream(path, rules):
+    # Read the document with iterparse and write each <file> section as soon
+    # as it's complete and cleaned up, so memory use is bounded by the
+    # largest section. The output is identical to cleanup_tree().
+    #
+    # Sections are serialized in an empty copy of the root element and cut
+    # out of it: serializing them on their own would repeat namespace
+    # declarations on every <file>.
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as fp:
+            root = None
+            written = 0
+            for event, node in iterparse(path, events=('start', 'end')):
+                if root is None:
+                    root = node
+                    shell = etree.Element(root.tag, root.attrib, nsmap=root.nsmap)
+                    shell.text = '\n  '
+                    start_tag, _, end_tag = etree.tostring(shell, encoding='UTF-8').partition(b'\n  ')
+                elif event == 'end' and node.tag == FILE_TAG and node.getparent() is root:
+                    root.remove(node)
+                    if not cleanup_file(node, rules):
+                        continue
+                    # Same indentation as indent(root), the tail depends on
+                    # the next section and is written separately.
+                    indent(node, 1)
+                    node.tail = None
+                    shell.append(node)
+                    section = etree.tostring(shell, encoding='UTF-8')
+                    shell.remove(node)
+                    if not written:
+                        fp.write(XML_DECLARATION + start_tag)
+                    fp.write(b'\n  ' + section[len(start_tag) + 3:len(section) - len(end_tag)])
+                    written += 1
+
+            # indent() also sets the tail of the root element
+            if written:
+                fp.write(b'\n' + end_tag + b'\n\n')
+            else:
+                shell.text = root.text
+                fp.write(XML_DECLARATION + etree.tostring(shell, encoding='UTF-8') + b'\n')
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.rename(temp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('files', nargs='*', help='XLIFF files to clean up in place')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read and write one <file> section at a time instead of '
+                             'loading whole documents in memory')
+    args = parser.parse_args()
+
+    rules = compile_rules()
+    for path in args.files:
+        try:
+            if args.stream:
+                cleanup_stream(path, rules)
+            else:
+                cleanup_tree(path, rules)
+        except Exception as e:
+            print("ERROR: Can't parse file %s" % path)
+            print(e)
+
 
 if __name__ == '__main__':
-    for path in sys.argv[1:]:
-        # Read it in and modify it in memory
-        with open(path) as fp:
-            try:
-                tree = etree.parse(fp)
-                root = tree.getroot()
-            except Exception as e:
-                print("ERROR: Can't parse file %s" % path)
-                print(e)
-                continue
-
-            # 1. Remove sections we do not care about
-            for file_node in root.xpath('//x:file', namespaces=NS):
-                file_name = file_node.get('original')
-                if file_name and file_name.endswith('Info.plist'):
-                    if file_name not in files_to_keep:
-                        file_node.getparent().remove(file_node)
-
-            for trans_node in root.xpath('//x:trans-unit', namespaces=NS):
-                file_name = trans_node.getparent().getparent().get('original')
-                source_string = trans_node.xpath('./x:source', namespaces=NS)[0].text
-                original_id = trans_node.get('id')
-
-                # 2. Remove strings we don't want to be translated
-                if file_name and file_name.endswith('Info.plist'):
-                    # TODO we should probably do the exception for SendTo in a nicer way with some kind of whitelist
-                    if original_id in strings_to_remove and not ((file_name == 'Extensions/SendTo/Info.plist' and original_id == 'CFBundleDisplayName') or (file_name == 'Extensions/ViewLater/Info.plist' and original_id == 'CFBundleDisplayName')):
-                        trans_node.getparent().remove(trans_node)
-
-                # 3. Copy English in required strings if there's no translation
-                if original_id in required_ids and len(trans_node.xpath('./x:target', namespaces=NS)) == 0:
-                    child = etree.Element('target')
-                    child.text = source_string
-                    trans_node.insert(1, child)
-
-            # 4. Remove empty file sections
-            for file_node in root.xpath('//x:file', namespaces=NS):
-                file_name = file_node.get('original')
-                if file_name.endswith('Info.plist'):
-                    trans_unit_nodes = file_node.xpath('x:body/x:trans-unit', namespaces=NS)
-                    if len(trans_unit_nodes) == 0:
-                        file_node.getparent().remove(file_node)
-        # Write it back to the same file
-        with open(path, 'w') as fp:
-            indent(root)
-            xliff_content = etree.tostring(
-                                tree,
-                                encoding='UTF-8',
-                                xml_declaration=True,
-                                pretty_print=True
-                            )
-            fp.write(xliff_content)
+    main()
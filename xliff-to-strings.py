@@ -17,15 +17,63 @@
 #
 # For any Info.plist file in the xliff, we generate a InfoPlist.strings.
 #
+# Strings files are written in UTF-8, or in UTF-16 with --encoding utf-16.
+# Quotes, backslashes and control characters are escaped.
+#
+# With --format binary, strings files are written as binary plists without
+# notes, for release builds. --encoding doesn't apply to them.
+#
+# With --source-root, strings files copied into extension bundles only include
+# the strings used by the extension's sources, found from the targets in
+# Client.xcodeproj (see DUPLICATE_SOURCES).
+#
+# With --manifest, the digest of each XLIFF file and of the export
+# configuration are stored with the strings files they produced and their
+# digests. Locales that didn't change since the previous run, and whose
+# strings files weren't modified, are skipped without being parsed, and
+# strings files that aren't produced anymore are removed.
+#
+# With --engine xslt, text strings files are rendered by an XSLT stylesheet
+# instead of Python code, with the same output. --benchmark compares the two
+# engines on all locales.
+#
+# With --jobs, several locales are exported in parallel. Locales that can't
+# be parsed are listed at the end, and stop the export unless
+# --ignore-errors is set.
+#
 
 import argparse
+import codecs
 import glob
+import hashlib
+import json
+import multiprocessing
 import os
 import sys
+from timeit import default_timer
 
 from lxml import etree
 
-NS = {'x':'urn:oasis:names:tc:xliff:document:1.2'}
+import binary_plist
+from source_index import SourceIndex
+from xcode_project import ProjectError, XcodeProject
+from xliff_common import NOTE_TAG, TARGET_TAG, find_files, find_units, parse
+
+text_type = type(u"")
+
+# Bump when the format of the manifest or the output of the script changes
+MANIFEST_VERSION = 2
+
+# Escape sequences in .strings files, used with unicode.translate(). Control
+# characters without a short escape sequence use \\U and 4 hex digits.
+STRING_ESCAPES = dict((code, u"\\U%04X" % code) for code in list(range(0x20)) + [0x7f])
+STRING_ESCAPES.update({
+    ord(u"\\"): u"\\\\",
+    ord(u'"'): u'\\"',
+    ord(u"\n"): u"\\n",
+    ord(u"\r"): u"\\r",
+    ord(u"\t"): u"\\t",
+})
 
 # Files we are interested in. It would be nice to not hardcode this but I'm not totally sure how yet.
 FILES = [
@@ -76,11 +124,10 @@ FILENAME_OVERRIDES = {
 # SendTo.strings is needed both in the main app and in the SendTo
 # extension.) See bug 1234322
 #
-# This is not ideal - but we currently have no good way to extract just the
-# strings that these extensions need. This copies all strings from the main
-# app's Localizable.strings into the extension bundles. This means the app
-# will grow in size a few 100KB. We should really add a filter function to
-# this list to limit the number of copied strings.
+# By default this copies all strings from the main app's Localizable.strings
+# into the extension bundles, which means the app will grow in size a few
+# 100KB. With --source-root, only the strings used by the sources of the
+# targets in DUPLICATE_SOURCES are copied.
 
 FILES_TO_DUPLICATE = {
     "Client/Localizable.strings": [
@@ -95,47 +142,509 @@ FILES_TO_DUPLICATE = {
     ],
 }
 
-def export_xliff_file(file_node, export_path, target_language):
+# Target of Client.xcodeproj the bundle of a duplicated strings file belongs
+# to. Its sources, and those of the frameworks it depends on, are read from
+# the project (see xcode_project.py).
+PROJECT_FILE = "Client.xcodeproj/project.pbxproj"
+
+DUPLICATE_SOURCES = {
+    "Extensions/ShareTo/Localizable.strings": "ShareTo",
+    "Extensions/NotificationService/Localizable.strings": "NotificationService",
+}
+
+# Stylesheet used by --engine xslt, renders the same text as
+# render_xliff_file() for each <file> node exported, in libxslt. The result
+# has a <strings index="..." original="..."> element for each of them, with
+# index the position of the <file> node in the document (starting at 1), and
+# original its name after FILENAME_OVERRIDES. The routing conditions are
+# filled in by strings_transform().
+STRINGS_XSLT = u"""<?xml version="1.0" encoding="UTF-8"?>
+<xsl:stylesheet version="1.0"
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform"
+    xmlns:x="urn:oasis:names:tc:xliff:document:1.2">
+  <xsl:output method="xml" encoding="UTF-8"/>
+
+  <xsl:template match="/">
+    <files>
+      <xsl:for-each select="//x:file">
+        <xsl:variable name="original">
+          <xsl:choose>
+%(overrides)s
+            <xsl:otherwise><xsl:value-of select="@original"/></xsl:otherwise>
+          </xsl:choose>
+        </xsl:variable>
+        <xsl:if test="%(files)s">
+          <strings index="{position()}" original="{$original}">
+            <xsl:apply-templates select="x:body/x:trans-unit"/>
+          </strings>
+        </xsl:if>
+      </xsl:for-each>
+    </files>
+  </xsl:template>
+
+  <!-- node()[1][self::text()] is the same as .text in lxml -->
+  <xsl:template match="x:trans-unit[@id and count(x:target) = 1 and x:target/node()[1][self::text()]]">
+    <xsl:if test="count(x:note) = 1">
+      <xsl:text>/* </xsl:text>
+      <xsl:call-template name="replace">
+        <xsl:with-param name="text" select="x:note/node()[1][self::text()]"/>
+        <xsl:with-param name="pattern" select="'*/'"/>
+        <xsl:with-param name="replacement" select="'* /'"/>
+      </xsl:call-template>
+      <xsl:text> */&#10;</xsl:text>
+    </xsl:if>
+    <xsl:text>"</xsl:text>
+    <xsl:call-template name="escape">
+      <xsl:with-param name="text" select="@id"/>
+    </xsl:call-template>
+    <xsl:text>" = "</xsl:text>
+    <xsl:call-template name="escape">
+      <xsl:with-param name="text" select="x:target/node()[1][self::text()]"/>
+    </xsl:call-template>
+    <xsl:text>";&#10;&#10;</xsl:text>
+  </xsl:template>
+
+  <xsl:template match="x:trans-unit"/>
+
+  <!-- Same as STRING_ESCAPES, XML 1.0 doesn't allow other control
+       characters -->
+  <xsl:template name="escape">
+    <xsl:param name="text"/>
+    <xsl:choose>
+      <xsl:when test="translate($text, '\\&quot;&#10;&#13;&#9;&#127;', '') = $text">
+        <xsl:value-of select="$text"/>
+      </xsl:when>
+      <xsl:otherwise>
+        <xsl:variable name="first" select="substring(translate($text, translate($text, '\\&quot;&#10;&#13;&#9;&#127;', ''), ''), 1, 1)"/>
+        <xsl:value-of select="substring-before($text, $first)"/>
+        <xsl:choose>
+          <xsl:when test="$first = '&#10;'">\\n</xsl:when>
+          <xsl:when test="$first = '&#13;'">\\r</xsl:when>
+          <xsl:when test="$first = '&#9;'">\\t</xsl:when>
+          <xsl:when test="$first = '&#127;'">\\U007F</xsl:when>
+          <xsl:otherwise>\\<xsl:value-of select="$first"/></xsl:otherwise>
+        </xsl:choose>
+        <xsl:call-template name="escape">
+          <xsl:with-param name="text" select="substring-after($text, $first)"/>
+        </xsl:call-template>
+      </xsl:otherwise>
+    </xsl:choose>
+  </xsl:template>
+
+  <xsl:template name="replace">
+    <xsl:param name="text"/>
+    <xsl:param name="pattern"/>
+    <xsl:param name="replacement"/>
+    <xsl:choose>
+      <xsl:when test="contains($text, $pattern)">
+        <xsl:value-of select="substring-before($text, $pattern)"/>
+        <xsl:value-of select="$replacement"/>
+        <xsl:call-template name="replace">
+          <xsl:with-param name="text" select="substring-after($text, $pattern)"/>
+          <xsl:with-param name="pattern" select="$pattern"/>
+          <xsl:with-param name="replacement" select="$replacement"/>
+        </xsl:call-template>
+      </xsl:when>
+      <xsl:otherwise>
+        <xsl:value-of select="$text"/>
+      </xsl:otherwise>
+    </xsl:choose>
+  </xsl:template>
+</xsl:stylesheet>
+"""
+
+# Compiled STRINGS_XSLT, see strings_transform()
+_strings_transform = None
+
+def escape_string(text):
+    # Escape text for a quoted string in a .strings file
+    return text_type(text).translate(STRING_ESCAPES)
+
+def escape_comment(text):
+    # A comment ends at the first */
+    return text_type(text).replace(u"*/", u"* /")
+
+def translated_units(file_node, keys=None):
+    # Yield (id, target, trans-unit node) for translated strings of a <file>
+    # node, in the same order as the XLIFF file. If keys is set, only
+    # strings with these ids are included.
+    for trans_unit_node in find_units(file_node):
+        trans_unit_id = trans_unit_node.get("id")
+        if keys is not None and trans_unit_id not in keys:
+            continue
+        targets = trans_unit_node.findall(TARGET_TAG)
+        if trans_unit_id is not None and len(targets) == 1 and targets[0].text is not None:
+            yield trans_unit_id, targets[0].text, trans_unit_node
+
+def render_xliff_file(file_node, keys=None):
+    # Render the text strings file for a <file> node
+    lines = []
+    for trans_unit_id, target_text, trans_unit_node in translated_units(file_node, keys):
+        notes = trans_unit_node.findall(NOTE_TAG)
+        if len(notes) == 1:
+            lines.append(u"/* %s */\n" % escape_comment(notes[0].text or u""))
+        lines.append(u"\"%s\" = \"%s\";\n\n" % (escape_string(trans_unit_id), escape_string(target_text)))
+    return u"".join(lines)
+
+def render_strings_file(file_node, keys, output_format, encoding):
+    # Render and encode the strings file for a <file> node. Binary plists
+    # don't include notes, they're only useful to translators.
+    if output_format == "binary":
+        items = [(text_type(trans_unit_id), text_type(target_text))
+                 for trans_unit_id, target_text, _ in translated_units(file_node, keys)]
+        if not items:
+            return b""
+        return binary_plist.dumps(items)
+    return encode_strings_file(render_xliff_file(file_node, keys), encoding)
+
+def xpath_literal(value):
+    # File names don't include quotes, XPath 1.0 literals can't escape them
+    assert "'" not in value
+    return u"'%s'" % value
+
+def xml_escape(text):
+    return text.replace(u"&", u"&amp;").replace(u"<", u"&lt;").replace(u'"', u"&quot;")
+
+def strings_transform():
+    # Compile STRINGS_XSLT for the current configuration, once per process
+    global _strings_transform
+    if _strings_transform is None:
+        overrides = u"\n".join(
+            u"            <xsl:when test=\"@original = %s\">%s</xsl:when>" % (
+                xml_escape(xpath_literal(original)), xml_escape(override))
+            for original, override in sorted(FILENAME_OVERRIDES.items()))
+        files = u" or ".join(u"$original = %s" % xpath_literal(original) for original in FILES)
+        stylesheet = STRINGS_XSLT % {"overrides": overrides, "files": xml_escape(files)}
+        _strings_transform = etree.XSLT(etree.fromstring(stylesheet.encode("utf-8")))
+    return _strings_transform
+
+def render_xliff_files_xslt(tree):
+    # Render all exported <file> nodes of a tree with STRINGS_XSLT, returns
+    # a list of (index, original, text) in document order. index is the
+    # position in find_files(tree) starting at 0.
+    result = strings_transform()(tree)
+    return [(int(node.get("index")) - 1, node.get("original"), node.text or u"")
+            for node in result.getroot()]
+
+def encode_strings_file(text, encoding):
+    # Encode a rendered strings file, empty files stay empty
+    if not text:
+        return b""
+    if encoding == "utf-16":
+        # Explicit byte order, so the output doesn't depend on the platform
+        return codecs.BOM_UTF16_LE + text.encode("utf-16-le")
+    return text.encode("utf-8")
+
+def write_strings_file(content, export_path):
+    # Write a rendered strings file, returns False if it's empty
     directory = os.path.dirname(export_path)
     if not os.path.exists(directory):
         os.makedirs(directory)
-    with open(export_path, "w") as fp:
-        for trans_unit_node in file_node.xpath("x:body/x:trans-unit", namespaces=NS):
-            trans_unit_id = trans_unit_node.get("id")
-            targets = trans_unit_node.xpath("x:target", namespaces=NS)
-
-            if trans_unit_id is not None and len(targets) == 1 and targets[0].text is not None:
-                notes = trans_unit_node.xpath("x:note", namespaces=NS)
-                if len(notes) == 1:
-                    line = u"/* %s */\n" % notes[0].text
-                    fp.write(line.encode("utf8"))
-                source_text = trans_unit_id.replace('"', '\\"')
-                target_text = targets[0].text.replace('"', '\\"')
-                line = u"\"%s\" = \"%s\";\n\n" % (source_text, target_text)
-                fp.write(line.encode("utf8"))
 
     # Export fails if the strings file is empty. Xcode probably checks
     # on file length vs read error.
-    contents = open(export_path).read()
-    if len(contents) == 0:
-        os.remove(export_path)
+    if len(content) == 0:
+        if os.path.exists(export_path):
+            os.remove(export_path)
+        return False
+
+    with open(export_path, "wb") as fp:
+        fp.write(content)
+    return True
 
 def original_path(root, target, original):
     dir,file = os.path.split(original)
     if file == "Info.plist":
         file = "InfoPlist.strings"
-    lproj = "%s.lproj" % target_language
+    lproj = "%s.lproj" % target
     path = dir + "/" + lproj + "/" + file
     return path
 
+def export_locale(xliff_path, export_root, used_keys=None, encoding="utf-8", output_format="text", engine="python"):
+    # Export each <file> node of a locale XLIFF file as a separate strings
+    # file. used_keys maps duplicated strings files to the set of keys to
+    # copy, see DUPLICATE_SOURCES. Returns a result dictionary with:
+    #  - messages: list of lines to display
+    #  - files: number of strings files written
+    #  - outputs: paths of the strings files written
+    #  - error: error message if the XLIFF file can't be parsed
+    result = new_result(xliff_path)
+    try:
+        tree = parse(xliff_path)
+    except Exception as e:
+        result["messages"].append("ERROR: Can't parse file %s" % xliff_path)
+        result["messages"].append(str(e))
+        result["error"] = str(e)
+        return result
+    return export_tree(tree, export_root, result, used_keys, encoding, output_format, engine)
+
+def new_result(xliff_path):
+    return {
+        "messages": ["Exporting {}".format(xliff_path)],
+        "files": 0,
+        "outputs": [],
+        "error": None,
+    }
+
+def export_tree(tree, export_root, result, used_keys=None, encoding="utf-8", output_format="text", engine="python"):
+    # Export a locale tree that is already parsed, messages and strings
+    # files written are added to result (see export_locale()), which is
+    # returned
+    messages = result["messages"]
+    root = tree.getroot()
+
+    # Make sure there are <file> nodes in this xliff file.
+    file_nodes = find_files(root)
+    if len(file_nodes) == 0:
+        messages.append("  ERROR: No translated files. Skipping.")
+        return result
+
+    # Take the target language from the first <file>. Not sure if that
+    # is a bug in the XLIFF, but in some files only the first node has
+    # the target-language set.
+    target_language = file_nodes[0].get('target-language')
+    if not target_language:
+        messages.append("  ERROR: Missing target-language. Skipping.")
+        return result
+
+    # Find the <file> nodes to export as (file node, original, text), with
+    # original the name after FILENAME_OVERRIDES. The XSLT engine renders
+    # the text of all of them in a single transform.
+    if engine == "xslt":
+        exports = [(file_nodes[index], original, text)
+                   for index, original, text in render_xliff_files_xslt(tree)]
+    else:
+        exports = []
+        for file_node in file_nodes:
+            original = file_node.get('original')
+            original = FILENAME_OVERRIDES.get(original, original)
+            if original in FILES:
+                exports.append((file_node, original, None))
+
+    # Export each <file> node as a separate strings file under the
+    # export root.
+    for file_node, original, text in exports:
+        # Because we have strings files that need to live in multiple bundles
+        # we build a list of (export_path, keys). Start with the default.
+        export_paths = [(original_path(export_root, target_language, original), None)]
+        for extra_copy in FILES_TO_DUPLICATE.get(original, []):
+            export_path = original_path(export_root, target_language, extra_copy)
+            export_paths.append((export_path, (used_keys or {}).get(extra_copy)))
+        # Render the file once for each set of keys, and write the same
+        # content to all paths using it. Copies with only used strings are
+        # always rendered in Python.
+        contents = {}
+        for export_path, keys in export_paths:
+            if keys is None:
+                messages.append("  Writing {} to {}".format(original, export_path))
+            else:
+                messages.append("  Writing {} to {} (only used strings)".format(original, export_path))
+            if keys not in contents:
+                if keys is None and text is not None:
+                    contents[keys] = encode_strings_file(text, encoding)
+                else:
+                    contents[keys] = render_strings_file(file_node, keys, output_format, encoding)
+            if write_strings_file(contents[keys], export_path):
+                result["files"] += 1
+                result["outputs"].append(export_path)
+
+    return result
+
+def export_locale_worker(task):
+    # Pool.imap() only passes one argument
+    xliff_path, export_root, used_keys, encoding, output_format, engine = task
+    return (xliff_path, export_locale(xliff_path, export_root, used_keys, encoding, output_format, engine))
+
+def file_digest(path):
+    with open(path, "rb") as fp:
+        return hashlib.sha1(fp.read()).hexdigest()
+
+def config_digest(args, used_keys):
+    # Digest of everything besides the XLIFF file that changes the strings
+    # files of a locale
+    config = {
+        "version": MANIFEST_VERSION,
+        "files": FILES,
+        "overrides": FILENAME_OVERRIDES,
+        "duplicates": FILES_TO_DUPLICATE,
+        "used_keys": dict((name, sorted(keys)) for name, keys in (used_keys or {}).items()),
+        "encoding": args.encoding,
+        "format": args.format,
+    }
+    content = json.dumps(config, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(content).hexdigest()
+
+class ExportManifest(object):
+    # Strings files exported for each locale, see --manifest. Entries are
+    # {"digest": ..., "outputs": {path: digest}} keyed by the path of the
+    # locale XLIFF file, digest is the digest of the input of the export.
+    # Strings files are in the working copy of the project, the digest of
+    # each one tells if a checkout replaced it.
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        # Entries of the previous run that weren't checked or updated yet
+        self.previous = self.read()
+        self.locales = {}
+        self.skipped = 0
+
+    def read(self):
+        # Entries of a different configuration are still returned, to
+        # remove their outputs, but with no digest so they're exported again.
+        try:
+            with open(self.path) as fp:
+                manifest = json.load(fp)
+        except (IOError, OSError, ValueError):
+            return {}
+        if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        locales = manifest["locales"]
+        if manifest["config"] != self.config:
+            for entry in locales.values():
+                entry["digest"] = None
+        return locales
+
+    def write(self):
+        # Locales that failed or weren't exported keep the outputs of the
+        # previous run, and are exported again next time
+        locales = dict(self.locales)
+        for xliff_path, entry in self.previous.items():
+            locales.setdefault(xliff_path, dict(entry, digest=None))
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w") as fp:
+            json.dump({"version": MANIFEST_VERSION, "config": self.config, "locales": locales}, fp,
+                      sort_keys=True, indent=1, separators=(",", ": "))
+        os.rename(temp_path, self.path)
+
+    def is_unchanged(self, xliff_path, digest):
+        # True if the locale was exported from the same input by the
+        # previous run and its strings files still have the same content
+        entry = self.previous.get(xliff_path)
+        if entry is None or entry["digest"] != digest:
+            return False
+        for path, output_digest in entry["outputs"].items():
+            if not os.path.exists(path) or file_digest(path) != output_digest:
+                return False
+        self.locales[xliff_path] = self.previous.pop(xliff_path)
+        self.skipped += 1
+        return True
+
+    def remove_missing(self, xliff_paths):
+        # Remove strings files of locales that are gone
+        for xliff_path in sorted(set(self.previous) - set(xliff_paths)):
+            print("Removing strings files of {}".format(xliff_path))
+            remove_outputs(self.previous.pop(xliff_path)["outputs"])
+
+    def update(self, xliff_path, digest, outputs):
+        # Record the strings files of an exported locale, and remove the ones
+        # it doesn't produce anymore
+        entry = self.previous.pop(xliff_path, None)
+        if entry is not None:
+            remove_outputs(set(entry["outputs"]) - set(outputs))
+        self.locales[xliff_path] = {
+            "digest": digest,
+            "outputs": dict((path, file_digest(path)) for path in outputs),
+        }
+
+def remove_outputs(paths):
+    # Remove strings files that were exported by a previous run
+    for path in sorted(paths):
+        if os.path.exists(path):
+            print("  Removing {}".format(path))
+            os.remove(path)
+            # Also remove the .lproj folder if it's now empty
+            directory = os.path.dirname(path)
+            if not os.listdir(directory):
+                os.rmdir(directory)
+
+def benchmark_engines(xliff_paths, repeat=3):
+    # Render all locales with both engines without writing anything, check
+    # that the output is identical and report the best time of each.
+    # Returns False if the output differs.
+    totals = {"python": 0.0, "xslt": 0.0}
+    identical = True
+    for xliff_path in xliff_paths:
+        try:
+            tree = parse(xliff_path)
+        except Exception:
+            print("{}: can't parse file, skipped".format(xliff_path))
+            continue
+        file_nodes = find_files(tree)
+
+        def render_python():
+            rendered = []
+            for index, file_node in enumerate(file_nodes):
+                original = file_node.get('original')
+                original = FILENAME_OVERRIDES.get(original, original)
+                if original in FILES:
+                    rendered.append((index, original, render_xliff_file(file_node)))
+            return rendered
+
+        timings = {}
+        outputs = {}
+        for engine, render in (("python", render_python), ("xslt", lambda: render_xliff_files_xslt(tree))):
+            best = None
+            for _ in range(repeat):
+                start = default_timer()
+                outputs[engine] = render()
+                elapsed = default_timer() - start
+                best = elapsed if best is None else min(best, elapsed)
+            timings[engine] = best
+            totals[engine] += best
+        print("{}: python {:.1f}ms, xslt {:.1f}ms".format(
+            xliff_path, timings["python"] * 1000, timings["xslt"] * 1000))
+        if outputs["python"] != outputs["xslt"]:
+            print("  ERROR: engines don't render the same strings files")
+            identical = False
+
+    print("Total: python {:.1f}ms, xslt {:.1f}ms".format(totals["python"] * 1000, totals["xslt"] * 1000))
+    return identical
+
+def find_used_keys(source_root, cache_path):
+    # Keys used by the sources of each duplicated strings file. Files are
+    # left out if their keys can't be determined, all strings are copied.
+    # Raises ProjectError if the project doesn't have the target, or lists
+    # Swift sources that aren't in source_root.
+    project = XcodeProject(os.path.join(source_root, PROJECT_FILE))
+    index = SourceIndex(source_root, cache_path)
+    index.build()
+    print("Scanned {} Swift files, {} from cache".format(index.scanned + index.cached, index.cached))
+    used_keys = {}
+    for duplicate, target in sorted(DUPLICATE_SOURCES.items()):
+        paths, folders = project.target_sources(target)
+        paths = [path for path in paths if path.endswith(".swift")]
+        missing = [path for path in paths if path not in index.files]
+        if missing:
+            raise ProjectError("{} sources of target {} are not in {}: {}".format(
+                len(missing), target, source_root, ", ".join(missing[:5])))
+        keys = index.used_keys(paths, folders)
+        if keys is None:
+            print("  {}: keys are not all literals, copying all strings".format(duplicate))
+        else:
+            print("  {}: {} keys used".format(duplicate, len(keys)))
+            used_keys[duplicate] = keys
+    return used_keys
+
 if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument("import_root", help="Path to folder including subfolders for all locales")
     parser.add_argument("export_root", help="Path to folder used to export .strings files")
     parser.add_argument("--ignore-errors", help="Ignore parsing errors in localized XLIFF files", action="store_true")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Number of locales to export in parallel (default: 1)")
+    parser.add_argument("--source-root", help="Path to the firefox-ios sources, only strings used by extensions are copied into their bundles")
+    parser.add_argument("--encoding", choices=["utf-8", "utf-16"], default="utf-8", help="Encoding of the .strings files (default: utf-8)")
+    parser.add_argument("--format", choices=["text", "binary"], default="text", help="Write text strings files, or binary plists without notes for release builds (default: text)")
+    parser.add_argument("--manifest", help="JSON file recording the strings files exported for each locale, unchanged locales are skipped")
+    parser.add_argument("--engine", choices=["python", "xslt"], default="python", help="Render text strings files in Python, or with an XSLT stylesheet (default: python)")
+    parser.add_argument("--benchmark", action="store_true", help="Compare the time each engine takes to render all locales, nothing is written")
+    parser.add_argument("--source-cache", help="JSON file used to cache the scan of Swift sources with --source-root")
     args = parser.parse_args()
 
+    if args.engine == "xslt" and args.format != "text":
+        parser.error("--engine xslt only renders text strings files")
+
     if not os.path.isdir(args.import_root):
         print("import path does not exist or is not a directory")
         sys.exit(1)
@@ -144,44 +653,73 @@ if __name__ == "__main__":
         print("export path does not exist or is not a directory")
         sys.exit(1)
 
-    for xliff_path in glob.glob(args.import_root + "/*/firefox-ios.xliff"):
-        print("Exporting {}".format(xliff_path))
-        with open(xliff_path) as fp:
-            try:
-                tree = etree.parse(fp)
-                root = tree.getroot()
-            except Exception as e:
-                print("ERROR: Can't parse file %s" % path)
-                print(e)
+    used_keys = None
+    if args.source_root:
+        try:
+            used_keys = find_used_keys(args.source_root, args.source_cache)
+        except ProjectError as e:
+            print("ERROR: Can't find the sources of extensions: {}".format(e))
+            sys.exit(1)
+
+    xliff_paths = sorted(glob.glob(args.import_root + "/*/firefox-ios.xliff"))
+
+    if args.benchmark:
+        sys.exit(0 if benchmark_engines(xliff_paths) else 1)
+
+    # Skip locales with the same XLIFF file and configuration as in the
+    # previous run, as long as their strings files are still there
+    manifest = None
+    digests = {}
+    if args.manifest:
+        manifest = ExportManifest(args.manifest, config_digest(args, used_keys))
+        for xliff_path in xliff_paths:
+            digests[xliff_path] = file_digest(xliff_path)
+        manifest.remove_missing(xliff_paths)
+        xliff_paths = [xliff_path for xliff_path in xliff_paths
+                       if not manifest.is_unchanged(xliff_path, digests[xliff_path])]
+
+    tasks = [(xliff_path, args.export_root, used_keys, args.encoding, args.format, args.engine)
+             for xliff_path in xliff_paths]
+    pool = None
+    if args.jobs > 1 and len(tasks) > 1:
+        # Locales don't share output files. imap() returns results in the
+        # same order as xliff_paths, so the output doesn't depend on
+        # scheduling.
+        pool = multiprocessing.Pool(min(args.jobs, len(tasks)))
+        results = pool.imap(export_locale_worker, tasks)
+    else:
+        results = (export_locale_worker(task) for task in tasks)
+
+    exported = 0
+    exported_files = 0
+    failed_paths = []
+    try:
+        for xliff_path, result in results:
+            for message in result["messages"]:
+                print(message)
+            sys.stdout.flush()
+            if result["error"] is not None:
+                failed_paths.append(xliff_path)
                 if not args.ignore_errors:
-                    sys.exit(1)
-
-            # Make sure there are <file> nodes in this xliff file.
-            file_nodes = root.xpath("//x:file", namespaces=NS)
-            if len(file_nodes) == 0:
-                print("  ERROR: No translated files. Skipping.")
-                continue
-
-            # Take the target language from the first <file>. Not sure if that
-            # is a bug in the XLIFF, but in some files only the first node has
-            # the target-language set.
-            target_language = file_nodes[0].get('target-language')
-            if not target_language:
-                print("  ERROR: Missing target-language. Skipping.")
-                continue
-
-            # Export each <file> node as a separate strings file under the
-            # export root.
-            for file_node in file_nodes:
-                original = file_node.get('original')
-                original = FILENAME_OVERRIDES.get(original, original)
-                if original in FILES:
-                    # Because we have strings files that need to live in multiple bundles
-                    # we build a list of export_paths. Start with the default.
-                    export_paths = [original_path(args.export_root, target_language, original)]
-                    for extra_copy in FILES_TO_DUPLICATE.get(original, []):
-                        export_path = original_path(args.export_root, target_language, extra_copy)
-                        export_paths.append(export_path)
-                    for export_path in export_paths:
-                        print("  Writing {} to {}".format(original, export_path))
-                        export_xliff_file(file_node, export_path, target_language)
+                    break
+            else:
+                exported += 1
+                exported_files += result["files"]
+                if manifest is not None:
+                    manifest.update(xliff_path, digests[xliff_path], result["outputs"])
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if manifest is not None:
+            manifest.write()
+
+    print("Exported {} strings files for {} locales".format(exported_files, exported))
+    if manifest is not None and manifest.skipped:
+        print("Skipped {} unchanged locales".format(manifest.skipped))
+    if failed_paths:
+        print("Locales not exported because of errors:")
+        for xliff_path in failed_paths:
+            print("  {}".format(xliff_path))
+        if not args.ignore_errors:
+            sys.exit(1)
@@ -0,0 +1,105 @@
+#
+# xliff_common.py
+#
+# XLIFF primitives shared by the scripts in this repository: namespace and
+# tag names, parsing, compiled XPath expressions, indexes of <file> and
+# <trans-unit> nodes, indentation and serialization, and load_script() to
+# import the scripts themselves.
+#
+# Parsing goes through a single XMLParser: entities aren't resolved, nothing
+# is fetched from the network, large text nodes are allowed and XML ids are
+# not collected, since XLIFF files don't use them.
+#
+
+import os
+
+from lxml import etree
+
+NS = {'x': 'urn:oasis:names:tc:xliff:document:1.2'}
+FILE_TAG = '{%s}file' % NS['x']
+TRANS_UNIT_TAG = '{%s}trans-unit' % NS['x']
+SOURCE_TAG = '{%s}source' % NS['x']
+TARGET_TAG = '{%s}target' % NS['x']
+NOTE_TAG = '{%s}note' % NS['x']
+
+PARSER_OPTIONS = {
+    'resolve_entities': False,
+    'no_network': True,
+    'huge_tree': True,
+    'collect_ids': False,
+}
+PARSER = etree.XMLParser(**PARSER_OPTIONS)
+
+SCRIPT_FOLDER = os.path.dirname(os.path.abspath(__file__))
+
+# All <file> nodes of a document, and <trans-unit> nodes of a <file>
+find_files = etree.XPath('//x:file', namespaces=NS)
+find_units = etree.XPath('x:body/x:trans-unit', namespaces=NS)
+
+
+def parse(source):
+    return etree.parse(source, PARSER)
+
+
+def iterparse(source, **options):
+    # etree.iterparse() with the same options as PARSER
+    arguments = dict(PARSER_OPTIONS)
+    arguments.update(options)
+    return etree.iterparse(source, **arguments)
+
+
+def file_index(root):
+    # {original: <file> node}
+    return dict((file_node.get('original'), file_node) for file_node in root.iter(FILE_TAG))
+
+
+def unit_index(root):
+    # {(file original, id): <trans-unit> node} for a document or a single
+    # <file>, in a single walk
+    units = {}
+    file_name = None
+    for node in root.iter(FILE_TAG, TRANS_UNIT_TAG):
+        if node.tag == FILE_TAG:
+            file_name = node.get('original')
+        else:
+            units[(file_name, node.get('id'))] = node
+    return units
+
+
+def indent(elem, level=0):
+    # Prettify XML output
+    # http://effbot.org/zone/element-lib.htm#prettyprint
+    i = '\n' + level*'  '
+    if len(elem):
+        if not elem.text or not elem.text.strip():
+            elem.text = i + '  '
+        if not elem.tail or not elem.tail.strip():
+            elem.tail = i
+        for elem in elem:
+            indent(elem, level+1)
+        if not elem.tail or not elem.tail.strip():
+            elem.tail = i
+    else:
+        if level and (not elem.tail or not elem.tail.strip()):
+            elem.tail = i
+
+
+def serialize(tree):
+    # Content of an XLIFF file, as written by all scripts
+    return etree.tostring(tree, encoding='UTF-8', xml_declaration=True, pretty_print=True)
+
+
+def load_script(file_name):
+    # Import one of the scripts of this folder as a module, their file names
+    # aren't valid module names
+    path = os.path.join(SCRIPT_FOLDER, file_name)
+    module_name = os.path.splitext(file_name)[0].replace('-', '_')
+    try:
+        import importlib.util
+    except ImportError:
+        import imp
+        return imp.load_source(module_name, path)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module